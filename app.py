@@ -7,11 +7,12 @@
 # - 사용 언어: Python 3
 # - 오픈소스 라이브러리(모두 무료):
 #   * streamlit .......... 웹 UI/상태 관리 (서버리스 배포 호환)
-#   * pdfminer.six ........ 텍스트 기반 PDF 본문 추출(표/머리글 라인 포함 텍스트)
-#   * pypdfium2 ........... PDF 간단 진단(페이지 로드 가능/이미지 스캔 추정), OCR 미적용
+#   * pypdfium2 ........... 텍스트 기반 PDF 본문 추출(기본) + 간단 진단(이미지 스캔 추정), OCR 미적용
+#   * pdfminer.six ........ pdfium 미설치/추출 실패 시 대체 추출기
 #   * python-docx .......... 결과 대본 DOCX 내보내기
-#   * regex(=regex 패키지) .. 한국어/유니코드 친화 정규식(파이썬 re 보강)
 #   * numpy ................ TF-IDF/코사인 유사도/텍스트랭크(전통 요약) 계산
+#   * numba(선택) .......... 대형 문서에서 텍스트랭크 반복 커널 JIT 가속(미설치 시 numpy 경로)
+#   * scipy(선택) .......... 대형 문서 TF-IDF 희소(CSR) 행렬(미설치 시 numpy 밀집 경로)
 #
 # [제출용 기술 주석: “AI 기능(유료 API 無)”]
 # - LLM 비사용(비용 無). 아래 전통/규칙 기반 파이프라인으로 “AI 기능” 구현:
@@ -34,25 +35,31 @@
 # ==========================================================
 
 import io
+import hashlib
+import heapq
+import importlib.util
+import threading
 import zipfile
 import re
 from collections import Counter
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Tuple
 
 import numpy as np
-import regex as rxx
 import streamlit as st
-from docx import Document
-from docx.shared import Pt
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from pathlib import Path
 
 # -------------------- ZIP 한글 파일명 표시 보정 --------------------
+_HANGUL_RE = re.compile(r"[가-힣]")
+
 def _zip_display_name(name: str) -> str:
     """Windows ZIP(cp949) -> Python cp437 decode mojibake: display fix only"""
     if not isinstance(name, str):
         return str(name)
     try:
-        if re.search(r"[가-힣]", name):
+        if _HANGUL_RE.search(name):
             return name
     except Exception:
         pass
@@ -63,24 +70,29 @@ def _zip_display_name(name: str) -> str:
             continue
     return name
 
-# ---------- [PDF 텍스트 추출 계층 — pdfminer 우선 / pdfium 진단] ----------
-pdf_extract_text = None
-try:
-    from pdfminer_high_level import extract_text as _wrong  # 방지: 과거 오타 경로
-    del _wrong
-except Exception:
-    pass
-try:
-    from pdfminer.high_level import extract_text as _extract_text
-    pdf_extract_text = _extract_text
-except Exception:
-    pdf_extract_text = None
+def zip_read_member(zip_bytes: bytes, name: str) -> bytes:
+    """ZIP 멤버 1개만 필요할 때 압축 해제(매번 새 핸들 → 재실행/워커 스레드 간 핸들 공유 없음)"""
+    with zipfile.ZipFile(io.BytesIO(zip_bytes), "r") as zf:
+        return zf.read(name)
+
+# ---------- [PDF 텍스트 추출 계층 — pdfium 우선 / pdfminer 대체] ----------
+# pdfminer/scipy/python-docx는 실제로 쓸 때 함수 안에서 import(콜드 스타트 단축). 여기서는 설치 여부만 확인
+HAS_PDFMINER = importlib.util.find_spec("pdfminer") is not None
 
 try:
     import pypdfium2 as pdfium
 except Exception:
     pdfium = None
 
+# ---------- [선택 가속 — numba 있으면 대형 문서 TextRank 커널 JIT] ----------
+try:
+    from numba import njit
+except Exception:
+    njit = None
+
+# ---------- [선택 — scipy 있으면 대형 문서 TF-IDF를 희소 행렬로] ----------
+HAS_SCIPY = importlib.util.find_spec("scipy") is not None
+
 # ---------- [Streamlit UI 설정 — 레이아웃 유지] ----------
 st.set_page_config(page_title="OPS2TBM", page_icon="🦺", layout="wide")
 
@@ -119,6 +131,10 @@ SEED_QUESTIONS = [
     "회전체·물림점 방호장치가 정상 동작합니까?"
 ]
 
+SPARSE_MIN_CELLS = 2_000_000  # 문장수×어휘수가 이 이상이면 TF-IDF를 CSR로(scipy 있을 때). 소형 문서는 밀집이 더 빠름
+SIM_MIN_DF = 2  # 유사도 행렬에 남길 최소 문서빈도(문장 1개에만 나온 어휘는 내적에 기여 0 → 노름 계산 뒤 열 제거)
+PDF_MAX_CHARS = 200_000  # PDF 1건당 추출 상한(문자). 요약(TextRank+MMR) 상위 k 선택에 충분한 분량
+
 # ---------- [세션 상태 초기화 — 저장소/KB/캐시] ----------
 def _init_once():
     ss = st.session_state
@@ -126,11 +142,14 @@ def _init_once():
     ss.setdefault("kb_terms", Counter())
     ss.setdefault("kb_actions", [])
     ss.setdefault("kb_questions", [])
+    ss.setdefault("kb_risk_terms", {})  # 업로드에서 학습한 위험어(시드 SEED_RISK_MAP 외) — 모듈 재실행에도 유지
     ss.setdefault("domain_toggle", False)
     ss.setdefault("profile_km", True)  # 키메세지 강화 파싱
     ss.setdefault("seed_loaded", False)
+    ss.setdefault("kb_rev", 0)  # KB 변경 카운터(요약/대본 캐시 무효화 키)
     ss.setdefault("last_file_diag", {})
     ss.setdefault("last_extracted_cache", "")
+    ss.setdefault("pdf_max_chars", PDF_MAX_CHARS)
 _init_once()
 
 # -------------------- 한국어 조사/띄어쓰기 보정 --------------------
@@ -153,14 +172,22 @@ TERM_FIXES = [
     (r"\b보\s*호\s*구\b","보호구"),
 ]
 
+# 정규식은 모듈 로드 시 1회 컴파일(호출마다 re 캐시 조회/컴파일 생략)
+_WS_RUN_RE = re.compile(r"\s+")
+_TERM_FIX_RES = tuple((re.compile(pat), rep) for pat, rep in TERM_FIXES)
+_SPACE_PUNCT_RE = re.compile(r"\s([,.])")
+_DUP_BEFORE_WORK_RE = re.compile(r"(작업\s*전\s*){2,}")
+_DUP_MUST_RE = re.compile(r"(반드시\s*){2,}")
+
 def tidy_korean_spaces(s: str) -> str:
-    s = re.sub(r"\s+", " ", s)
-    for pat, rep in TERM_FIXES:
-        s = re.sub(pat, rep, s)
+    # 바꿀 것이 없으면 정규식 패스를 건너뜀: 공백 아닌 공백문자(\t·\n·\u3000 등)는 모두 isprintable()=False
+    if "  " in s or not s.isprintable(): s = _WS_RUN_RE.sub(" ", s)
+    for pat, rep in _TERM_FIX_RES:
+        s = pat.sub(rep, s)
     s = s.replace("전충분한","전 충분한").replace("전충분히","전 충분히")
-    s = re.sub(r"\s([,.])", r"\1", s)
-    s = re.sub(r"(작업\s*전\s*){2,}", "작업 전 ", s)
-    s = re.sub(r"(반드시\s*){2,}", "반드시 ", s)
+    if " ," in s or " ." in s: s = _SPACE_PUNCT_RE.sub(r"\1", s)  # 위 단계 이후 남은 공백문자는 " "뿐
+    if s.count("작업") > 1: s = _DUP_BEFORE_WORK_RE.sub("작업 전 ", s)
+    if s.count("반드시") > 1: s = _DUP_MUST_RE.sub("반드시 ", s)
     return s.strip()
 
 # -------------------- 전처리 파이프라인 --------------------
@@ -184,7 +211,7 @@ DATE_PAT = r"([’']?\d{2,4})\.\s?(\d{1,2})\.\s?(\d{1,2})\.?"
 META_PATTERNS = [
     r"<\s*[^>]*?(사망|사상|부상|의식불명)[^>]*>"
 ]
-STOP_TERMS = set("""
+STOP_TERMS = frozenset("""
 및 등 관련 사항 내용 예방 안전 작업 현장 교육 방법 기준 조치
 실시 확인 필요 경우 대상 사용 관리 점검 적용 정도 주의 중 전 후
 주요 사례 안전작업방법 포스터 동영상 리플릿 가이드 자료실 검색
@@ -204,75 +231,131 @@ PROMO_TAIL = r"(동영상|교안|포털|검색|사이렌|공단)$"
 PROMO_MID = r"(‘?안전보건공단’?|산업안전보건공단|산업안전포털|안전보건포털|중대재해\s*사이렌|OPS|VR|동영상|교안|포털|검색|APP|애플리케이션)(?:\s*(보기|참조|검색|바로가기))?"
 ACCIDENT_PAT = r"(사망|사상|중독|추락|붕괴|낙하|질식|끼임|깔림|부딪힘|감전|폭발)(\s*추정)?"
 
-RISK_KEYWORDS = dict(SEED_RISK_MAP)
+# 잡음 패턴을 두 개의 교대식으로 합침: ^ 고정 패턴은 줄 머리에서 match 1회, 나머지는 search 1회
+_NOISE_HEAD_RE = re.compile("|".join(f"(?:{p[1:]})" for p in NOISE_PATTERNS if p.startswith("^")), re.IGNORECASE)
+_NOISE_ANY_RE = re.compile("|".join(f"(?:{p})" for p in NOISE_PATTERNS if not p.startswith("^")), re.IGNORECASE)
+_BULLET_RE = re.compile(BULLET_PREFIX)
+_DATE_RE = re.compile(DATE_PAT)
+_ACCIDENT_RE = re.compile(ACCIDENT_PAT)
+_PREV_HINT_RE = re.compile(PREV_HINT)
+_BUL_MARK_RE = re.compile(BUL_MARK)
+_BUL_SPLIT_RE = re.compile(BUL_MARK + r"\s*")
+_PROMO_TAIL_RE = re.compile(PROMO_TAIL)
+
+# 단순 문자 범위뿐이라 표준 re로 충분(regex보다 빠름). ASCII 전용 문장은 더 좁은 패턴으로 처리
+_TOKEN_RE = re.compile(r"[가-힣a-z0-9]{2,}")
+_TOKEN_RE_ASCII = re.compile(r"[a-z0-9]{2,}")
 
 def tokens(s: str) -> List[str]:
-    return rxx.findall(r"[가-힣a-z0-9]{2,}", s.lower())
+    s = s.lower()
+    return (_TOKEN_RE_ASCII if s.isascii() else _TOKEN_RE).findall(s)
+
+# re의 \s 와 같은 문자 집합(str.isspace) — 정규식 대신 C 레벨 translate로 공백 제거
+_WS_TABLE = str.maketrans("", "", "\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f \x85\xa0\u1680"
+                          "\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007\u2008\u2009\u200a"
+                          "\u2028\u2029\u202f\u205f\u3000")
+
+def uniq_keep(seq: List[str]) -> List[str]:
+    """공백 무시 키 기준 중복 제거(첫 등장 순서 유지)"""
+    first: Dict[str, str] = {}
+    for x in seq:
+        first.setdefault(x.translate(_WS_TABLE), x)
+    return list(first.values())
+
+_TRAIL_WS_RE = re.compile(r"[ \t]+\n")
+_MULTI_NL_RE = re.compile(r"\n{3,}")
 
 def normalize_text(t: str) -> str:
+    # 부분 문자열 검사(C 단일 스캔)로 바꿀 것이 없는 정규식 패스는 건너뜀. \x0c는 replace가 translate보다 훨씬 빠름
     t = t.replace("\x0c","\n")
-    t = re.sub(r"[ \t]+\n","\n", t)
-    t = re.sub(r"\n{3,}","\n\n", t)
+    if " \n" in t or "\t\n" in t: t = _TRAIL_WS_RE.sub("\n", t)
+    if "\n\n\n" in t: t = _MULTI_NL_RE.sub("\n\n", t)
     return t.strip()
 
+_PROMO_QUOTED_RE = re.compile(r"[‘'\"“”]?"+PROMO_MID+r"[’'\"“”]?")
+_APP_PAREN_RE = re.compile(r"(스마트폰\s*APP|애플리케이션)\s*\(\s*\)")
+_APP_RE = re.compile(r"(스마트폰\s*APP|애플리케이션)")
+_PROMO_BRACKET_RE = re.compile(r"[\(\[\]＜<]{1}\s*"+PROMO_MID+r"\s*[\)\]\＞>]{1}")
+_PROMO_COMMA_RE = re.compile(r"(,\s*)?"+PROMO_MID+r"(\s*,)?")
+_EMPTY_PAREN_RE = re.compile(r"\(\s*\)")
+
+_PROMO_MID_RE = re.compile(PROMO_MID)
+
 def strip_promo_inside(s: str) -> str:
-    s = re.sub(r"[‘'\"“”]?"+PROMO_MID+r"[’'\"“”]?", "", s)
-    s = re.sub(r"(스마트폰\s*APP|애플리케이션)\s*\(\s*\)", "", s)
-    s = re.sub(r"(스마트폰\s*APP|애플리케이션)", "", s)
-    s = re.sub(r"[\(\[\]＜<]{1}\s*"+PROMO_MID+r"\s*[\)\]\＞>]{1}", "", s)
-    s = re.sub(r"(,\s*)?"+PROMO_MID+r"(\s*,)?", "", s)
-    s = re.sub(r"\(\s*\)", "", s)
+    # 앞의 5개 패턴은 모두 PROMO_MID(APP/애플리케이션 포함)가 있어야 일치 → 대부분의 줄은 검사 1회로 통과
+    if _PROMO_MID_RE.search(s):
+        s = _PROMO_QUOTED_RE.sub("", s)
+        s = _APP_PAREN_RE.sub("", s)
+        s = _APP_RE.sub("", s)
+        s = _PROMO_BRACKET_RE.sub("", s)
+        s = _PROMO_COMMA_RE.sub("", s)
+    if "(" in s: s = _EMPTY_PAREN_RE.sub("", s)
     return s
 
+_DOC_NO_RE = re.compile(r"\d{4}-\w+-\d{1,3}\s*\w*")
+_URL_RE = re.compile(r"https?://\S+")
+_AGENCY_TAIL_RE = re.compile(r"(산업안전보건공단|안전보건공단|산업안전포털|안전보건포털)\s*$")
+_CASE_TAIL_RE = re.compile(r"(사고사례)\s*$")
+_NOTICE_TAIL_RE = re.compile(r"※\s*위\s*내용은\s*신고.*변경될\s*수\s*있음.*$")
+_SECTION_TAIL_RE = re.compile(r"(안전작업방법|콘텐츠\s*링크|주요사고개요)$")
+
 def strip_noise_line(line: str) -> str:
     s = (line or "").strip()
     if not s: return ""
     
     # 문서 번호 제거: "2025-교육혁신실-212 5호"와 같은 형식
-    s = re.sub(r"\d{4}-\w+-\d{1,3}\s*\w*", "", s)  # 문서 번호 제거
+    s = _DOC_NO_RE.sub("", s)  # 문서 번호 제거
     
-    s = re.sub(BULLET_PREFIX, "", s).strip()
+    s = _BULLET_RE.sub("", s).strip()
     
-    for pat in NOISE_PATTERNS:
-        if re.search(pat, s, re.IGNORECASE):
-            return ""
+    if _NOISE_HEAD_RE.match(s) or _NOISE_ANY_RE.search(s):
+        return ""
     
-    s = re.sub(r"https?://\S+", "", s).strip()
+    s = _URL_RE.sub("", s).strip()
     s = strip_promo_inside(s)
-    s = re.sub(r"(산업안전보건공단|안전보건공단|산업안전포털|안전보건포털)\s*$","", s).strip()
-    s = re.sub(r"(사고사례)\s*$","", s).strip()
-    s = re.sub(r"※\s*위\s*내용은\s*신고.*변경될\s*수\s*있음.*$","", s).strip()
+    s = _AGENCY_TAIL_RE.sub("", s).strip()
+    s = _CASE_TAIL_RE.sub("", s).strip()
+    s = _NOTICE_TAIL_RE.sub("", s).strip()
     s = s.strip("•●▪▶▷·-—–,")
-    s = re.sub(r"(안전작업방법|콘텐츠\s*링크|주요사고개요)$","", s).strip()
-    s = re.sub(rf"{PROMO_TAIL}","", s).strip()
+    s = _SECTION_TAIL_RE.sub("", s).strip()
+    s = _PROMO_TAIL_RE.sub("", s).strip()
     s = tidy_korean_spaces(s)
     
     return s
 
 
+_HEADING_RE = re.compile(r"(방법|수칙|대책|안전조치|예방|작업방법|사고사례|주요\s*사고사례|사고개요)\s*[:：]?$")
+_SAFE_METHOD_HEAD_RE = re.compile(r"^(안전\s*작업\s*방법|안전작업방법)\s*")
+_FILLER_TEXT_RE = re.compile(r"텍스트(\s+텍스트){1,}")
+_SENT_END_RE = re.compile(r"[.?!다]$")
+
 def _looks_like_heading(s: str) -> bool:
-    return bool(re.search(r"(방법|수칙|대책|안전조치|예방|작업방법|사고사례|주요\s*사고사례|사고개요)\s*[:：]?$", s))
+    return bool(_HEADING_RE.search(s))
 
 def split_inline_check_bullets(s: str) -> List[str]:
-    if not re.search(BUL_MARK, s):
+    if not _BUL_MARK_RE.search(s):
         return [s]
-    parts = re.split(rf"{BUL_MARK}\s*", s)
+    parts = _BUL_SPLIT_RE.split(s)
     out: List[str] = []
     for idx, p in enumerate(parts):
         p = p.strip(" -•·\t")
         if not p: continue
-        p = re.sub(r"^(안전\s*작업\s*방법|안전작업방법)\s*", "", p)
-        if re.search(r"텍스트(\s+텍스트){1,}", p): 
+        p = _SAFE_METHOD_HEAD_RE.sub("", p)
+        if _FILLER_TEXT_RE.search(p): 
             continue
         if idx == 0 and len(parts) > 1:
-            if len(p) < 120 and not re.search(PROMO_TAIL, p):
+            if len(p) < 120 and not _PROMO_TAIL_RE.search(p):
                 out.append(p)
         else:
             out.append(p)
     return out
 
 def merge_broken_lines(lines: List[str]) -> List[str]:
-    out, buf = [], ""
+    # 병합 중인 줄은 조각 리스트로 모았다가 내보낼 때 1회만 결합·정리(긴 문서의 반복 문자열 연결 O(n²) 방지)
+    # 병합 판정은 마지막 조각의 끝 글자만 보면 됨(조각은 이미 정리된 문자열이라 결합해도 끝 글자 불변)
+    out, parts = [], []
+    def flush():
+        if parts: out.append(parts[0] if len(parts) == 1 else tidy_korean_spaces(" ".join(parts)))
     for raw in lines:
         chunks = split_inline_check_bullets(raw)
         for chunk in chunks:
@@ -280,40 +363,38 @@ def merge_broken_lines(lines: List[str]) -> List[str]:
             if not s:
                 continue
             if _looks_like_heading(s) or s.endswith((":", "：", "-", "·")):
-                if buf: out.append(buf)
-                buf = s
+                flush(); parts = [s]
                 continue
-            if buf:
-                if re.search(BUL_MARK, raw):
-                    out.append(buf); buf = s
+            if parts:
+                if _BUL_MARK_RE.search(raw):
+                    flush(); parts = [s]
                     continue
-                if buf.endswith((":", "：", "-", "·")):
-                    buf = tidy_korean_spaces(buf.rstrip(" :：-·") + " " + s)
+                if parts[-1].endswith((":", "：", "-", "·")):
+                    parts[-1] = parts[-1].rstrip(" :：-·"); parts.append(s)
                     continue
-                if (len(buf) < 20 and not re.search(r"[.?!다]$", buf)) or (len(s) < 20 and not re.search(r"[.?!다]$", s)):
-                    buf = tidy_korean_spaces(buf + " " + s)
+                if not _SENT_END_RE.search(parts[-1]) or (len(s) < 20 and not _SENT_END_RE.search(s)):
+                    parts.append(s)
                     continue
-                if not re.search(r"[.?!다]$", buf):
-                    buf = tidy_korean_spaces(buf + " " + s)
-                    continue
-                out.append(buf); buf = s
+                flush(); parts = [s]
             else:
-                buf = s
-    if buf: out.append(buf)
+                parts = [s]
+    flush()
     return out
 
+_ACC_OUTLINE_RE = re.compile(r"^사고\s*개요")
+
 def combine_date_with_next(lines: List[str]) -> List[str]:
     out = []; i = 0
     while i < len(lines):
         cur = strip_noise_line(lines[i])
-        if re.search(DATE_PAT, cur) and (i+1) < len(lines):
+        m = _DATE_RE.search(cur)
+        if m and (i+1) < len(lines):
             nxt_raw = lines[i+1]
             nxt = strip_noise_line(nxt_raw)
-            starts_acc_outline = bool(re.match(r"^사고\s*개요", nxt))
-            is_acc = bool(re.search(ACCIDENT_PAT, nxt))
-            looks_prev = bool(re.search(PREV_HINT, nxt)) or bool(re.search(BUL_MARK, nxt_raw)) or len(nxt) > 220
+            starts_acc_outline = bool(_ACC_OUTLINE_RE.match(nxt))
+            is_acc = bool(_ACCIDENT_RE.search(nxt))
+            looks_prev = bool(_PREV_HINT_RE.search(nxt)) or bool(_BUL_MARK_RE.search(nxt_raw)) or len(nxt) > 220
             if is_acc and not looks_prev and not starts_acc_outline:
-                m = re.search(DATE_PAT, cur)
                 y, mo, d = m.groups()
                 y = int(str(y).replace("’","").replace("'","")); y = 2000 + y if y < 100 else y
                 out.append(f"{int(y)}년 {int(mo)}월 {int(d)}일, {nxt}")
@@ -324,6 +405,7 @@ def combine_date_with_next(lines: List[str]) -> List[str]:
 
 CASE_JOIN_TRIG = ("쓰러지자","구조하던 중","차례로","이어","이후","동시에","결국","그 과정에서","외부에 있던","현장에 있던")
 CASE_KEYWORDS = ("사망","사상","중독","추락","붕괴","낙하","질식","끼임","깔림","부딪힘","감전","폭발","사고","사고개요")
+_CASE_KW_RE = re.compile("|".join(CASE_KEYWORDS))
 
 def stitch_case_blocks(sents: List[str]) -> List[str]:
     if not sents:
@@ -337,15 +419,12 @@ def stitch_case_blocks(sents: List[str]) -> List[str]:
         merged_any = False
         while j < len(sents):
             nxt = sents[j].strip()
-            cond_keyword = (
-                any(k in cur for k in CASE_KEYWORDS)
-                and any(k in nxt for k in CASE_KEYWORDS)
-            )
-            cur_date = re.search(DATE_PAT, cur)
-            nxt_date = re.search(DATE_PAT, nxt)
+            cond_keyword = bool(_CASE_KW_RE.search(cur) and _CASE_KW_RE.search(nxt))
+            cur_date = _DATE_RE.search(cur)
+            nxt_date = _DATE_RE.search(nxt)
             if cur_date and nxt_date and cur_date.group(0) != nxt_date.group(0):
                 cond_keyword = False
-            cond_prev_like = bool(re.search(PREV_HINT, nxt)) or nxt.startswith("사고 개요")
+            cond_prev_like = bool(_PREV_HINT_RE.search(nxt)) or nxt.startswith("사고 개요")
             if cond_keyword and not cond_prev_like:
                 sep = ", " if not merged.endswith(("다.","습니다.","했다.",".")) else " "
                 merged = tidy_korean_spaces(merged.rstrip(" .") + sep + nxt.lstrip(" ,"))
@@ -356,14 +435,13 @@ def stitch_case_blocks(sents: List[str]) -> List[str]:
                 break
         out.append(merged)
         i = j if merged_any else i + 1
-    seen, dedup = set(), []
-    for s in out:
-        k = re.sub(r"\s+","", s)
-        if k not in seen:
-            seen.add(k)
-            dedup.append(s)
-    return dedup
+    return uniq_keep(out)
+
 
+# "다."도 마침표로 끝나므로 후방탐색은 [.!?] 하나로 충분 → 표준 re로 컴파일(regex 모듈보다 빠름).
+# 공백은 regex 모듈 \s(유니코드 White_Space)와 같게: 표준 re \s에서 \x1c-\x1f 제외
+_SENT_SPLIT_RE = re.compile(r"(?<=[.!?])[^\S\x1c-\x1f]+|\n+")
+_SECTION_END_RE = re.compile(r"(주요사고|안전작업방법|콘텐츠링크|주요 사고개요)$")
 
 def preprocess_text_to_sentences(text: str) -> List[str]:
     text = normalize_text(text)
@@ -371,18 +449,39 @@ def preprocess_text_to_sentences(text: str) -> List[str]:
     lines = merge_broken_lines(raw_lines)
     lines = combine_date_with_next(lines)
     joined = "\n".join(lines)
-    raw = rxx.split(r"(?<=[\.!\?]|다\.)\s+|\n+", joined)
+    raw = _SENT_SPLIT_RE.split(joined)
     sents = []
     for s in raw:
         s2 = strip_noise_line(s)
         if not s2: continue
-        if re.search(r"(주요사고|안전작업방법|콘텐츠링크|주요 사고개요)$", s2): continue
-        if len(re.sub(r"\s+","", s2)) < 4:
+        if _SECTION_END_RE.search(s2): continue
+        if len(s2.translate(_WS_TABLE)) < 4:
             continue
         sents.append(s2)
     sents = stitch_case_blocks(sents)
     return sents
 
+def text_digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+def session_lru(name: str, key, compute, cap: int):
+    """재실행 간 세션 LRU 캐시(st.session_state[name]) — 적중 시 맨 뒤로, 초과 시 가장 오래된 항목 제거"""
+    cache = st.session_state.setdefault(name, {})
+    hit = cache.pop(key, None)
+    if hit is None:
+        hit = compute()
+        if len(cache) >= cap:
+            del cache[next(iter(cache))]
+    cache[key] = hit
+    return hit
+
+def tokenize_doc(text: str) -> Tuple[List[str], List[List[str]]]:
+    """문장 분할 + 문장별 토큰을 1회만 계산(재실행 간 세션 LRU 캐시, blake2b 다이제스트 키)"""
+    def _build():
+        sents = preprocess_text_to_sentences(text)
+        return sents, [tokens(s) for s in sents]
+    return session_lru("_tok_cache", text_digest(text), _build, 8)
+
 # -------------------- (1) 헤더 기반 섹션 파서 --------------------
 SECTION_HEADERS_CASE = [
     r"주요\s*사고사례", r"사고사례", r"사고\s*사례",
@@ -395,22 +494,22 @@ SECTION_HEADERS_PREV = [
     r"안전\s*대책", r"예방\s*대책", r"핵심\s*수칙", r"10대\s*안전\s*수칙",
     r"현장\s*안전\s*수칙", r"안전\s*작업\s*요령"
 ]
-def _compile_headers(headers: List[str]) -> List[re.Pattern]:
-    return [re.compile(h, re.IGNORECASE) for h in headers]
+def _compile_headers(headers: List[str]) -> re.Pattern:
+    """헤더 목록을 교대식 1개로 컴파일(줄마다 헤더 수만큼 search하지 않고 1회 스캔)"""
+    return re.compile("|".join(f"(?:{h})" for h in headers), re.IGNORECASE)
 HDR_CASE = _compile_headers(SECTION_HEADERS_CASE)
 HDR_PREV = _compile_headers(SECTION_HEADERS_PREV)
+HDR_ANY = _compile_headers(SECTION_HEADERS_CASE + SECTION_HEADERS_PREV)
 
 def split_keep_lines(text: str) -> List[str]:
-    t = normalize_text(text)
-    lines = [ln.rstrip() for ln in t.splitlines()]
-    return lines
-
-def _is_header(line: str, hdrs: List[re.Pattern]) -> bool:
-    s = strip_noise_line(line)
-    return any(h.search(s) for h in hdrs)
+    """정규화된 줄 목록 — 대본 1회 생성에 섹션 추출/클러스터링이 여러 번 쓰므로 문서 단위 세션 캐시(읽기 전용으로 사용)"""
+    def _build():
+        return [ln.rstrip() for ln in normalize_text(text).splitlines()]
+    return session_lru("_lines_cache", text_digest(text), _build, 4)
 
 def _is_bullet(line: str) -> bool:
-    return bool(re.match(BULLET_PREFIX, line.strip()) or re.match(r"^\s*[\-·•▶▷\*]\s+", line.strip()) or re.search(BUL_MARK, line))
+    # "^\s*[-·•▶▷*]\s+" 형태는 BULLET_PREFIX(-·•▶▷* 포함)가 이미 잡으므로 별도 검사 불필요
+    return bool(_BULLET_RE.match(line.strip()) or _BUL_MARK_RE.search(line))
 
 def extract_section_bullets(text: str, which: str = "case") -> List[str]:
     lines = split_keep_lines(text)
@@ -418,23 +517,22 @@ def extract_section_bullets(text: str, which: str = "case") -> List[str]:
     items: List[str] = []
     capture = False
     for raw in lines:
-        s = raw.strip()
-        if not s:
+        if not raw.strip():
             if capture: break
             continue
-        if _is_header(raw, hdrs):
+        clean = strip_noise_line(raw)  # 헤더 판정과 본문 정리에 공용(줄당 1회)
+        if hdrs.search(clean):
             capture = True
             continue
         if capture:
-            if _is_header(raw, HDR_CASE + HDR_PREV):
+            if HDR_ANY.search(clean):
                 break
-            clean = strip_noise_line(raw)
             if not clean:
                 continue
             for ck in split_inline_check_bullets(clean):
                 if ck: items.append(ck)
     merged = merge_broken_lines(items)
-    return [x for x in merged if len(re.sub(r"\s+","", x)) >= 2]
+    return [x for x in merged if len(x.translate(_WS_TABLE)) >= 2]
 
 # -------------------- (2) 헤더無 문서: 불릿 클러스터 + 자동 분류 --------------------
 ACTION_VERBS = [
@@ -447,6 +545,7 @@ ACTION_PAT = (
     r"(?P<obj>[가-힣a-zA-Z0-9·\(\)\[\]\/\-\s]{2,}?)\s*(?P<verb>" + "|".join(ACTION_VERBS) + r"|실시|운영|관리)\b"
     r"|(?P<obj2>[가-힣a-zA-Z0-9·\(\)\[\]\/\-\s]{2,}?)\s*(을|를)\s*(?P<verb2>" + "|".join(ACTION_VERBS) + r"|실시|운영|관리)\b"
 )
+_ACTION_RE = re.compile(ACTION_PAT)
 
 def cluster_bullets(text: str) -> List[List[str]]:
     lines = split_keep_lines(text)
@@ -465,16 +564,16 @@ def cluster_bullets(text: str) -> List[List[str]]:
         clusters.append(merge_broken_lines(cur))
     cleaned = []
     for c in clusters:
-        c2 = [x for x in c if x and len(re.sub(r"\s+","", x)) >= 2]
+        c2 = [x for x in c if x and len(x.translate(_WS_TABLE)) >= 2]
         if c2:
             cleaned.append(c2)
     return cleaned
 
 def looks_case(s: str) -> bool:
-    return bool(re.search(ACCIDENT_PAT, s))
+    return bool(_ACCIDENT_RE.search(s))
 
 def looks_action(s: str) -> bool:
-    return bool(re.search(ACTION_PAT, s) or re.search(PREV_HINT, s))
+    return bool(_ACTION_RE.search(s) or _PREV_HINT_RE.search(s))
 
 def classify_cluster(cluster: List[str]) -> str:
     case_hits = sum(1 for x in cluster if looks_case(x))
@@ -484,105 +583,281 @@ def classify_cluster(cluster: List[str]) -> str:
     return "other"
 
 def extract_clusters_by_type(text: str, kind: str) -> List[str]:
-    clusters = cluster_bullets(text)
+    # 클러스터링+분류는 문서당 1회(사례/예방 추출이 같은 결과를 공유)
+    typed = session_lru("_cluster_cache", text_digest(text),
+                        lambda: [(classify_cluster(c), c) for c in cluster_bullets(text)], 4)
     out: List[str] = []
-    for c in clusters:
-        typ = classify_cluster(c)
+    for typ, c in typed:
         if typ == kind:
             out += c
     return out
 
 # -------------------- PDF 읽기/진단 --------------------
-def read_pdf_text_from_bytes(b: bytes, fname: str = "") -> str:
-    t = ""
+def _pdfminer_text_upto(bio, max_chars: int) -> str:
+    """pdfminer extract_text와 같은 출력을 페이지 단위로 누적, max_chars 도달 시 나머지 페이지는 파싱 안 함"""
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+    rsrc = PDFResourceManager(caching=True)
+    with io.StringIO() as out:
+        interp = PDFPageInterpreter(rsrc, TextConverter(rsrc, out, laparams=LAParams()))
+        for page in PDFPage.get_pages(bio, caching=True):
+            interp.process_page(page)
+            if out.tell() >= max_chars: break
+        return out.getvalue()[:max_chars]
+
+@st.cache_resource(show_spinner=False)
+def _pdfium_lock() -> threading.Lock:
+    """PDFium은 스레드 안전하지 않음(문서가 달라도 동시 호출 금지) → 화면 스레드/학습 워커가 공유하는 프로세스 잠금.
+    같은 이유로 페이지 병렬 추출은 하지 않음"""
+    return threading.Lock()
+
+def _pdfium_text_upto(b: bytes, max_chars: int) -> str:
+    """pdfium 텍스트 레이어를 페이지 단위로 누적(pdfminer 대비 수 배~수십 배 빠름), max_chars 도달 시 중단"""
+    with _pdfium_lock():
+        return _pdfium_text_upto_locked(b, max_chars)
+
+PDFIUM_BLOCK_GAP = 1.5  # 텍스트 사각형 간 세로 간격이 페이지 줄 간격(하위 사분위)의 이 배수를 넘으면 블록 경계(빈 줄)
+
+def _pdfium_page_text(tp) -> str:
+    """페이지 텍스트 + 세로 간격이 큰 텍스트 블록 사이에 빈 줄 삽입.
+    get_text_range는 블록 사이를 줄바꿈 1개로만 잇지만 pdfminer는 텍스트 상자마다 빈 줄을 둠 → 빈 줄에서 멈추는 섹션 추출과 맞춤"""
+    t = tp.get_text_range()
+    bases, starts, pos = [], [], 0
+    for i in range(tp.count_rects()):
+        left, bottom, right, top = tp.get_rect(i)
+        seg = tp.get_text_bounded(left, bottom, right, top).strip()
+        k = t.find(seg, pos) if seg else -1
+        if k < 0: continue  # 본문에서 위치를 못 찾은 사각형은 간격 판정에서 제외
+        bases.append(bottom); starts.append(k); pos = k + len(seg)
+    # 아랫변(≈기준선)으로 비교 — 윗변은 글꼴·글머리표마다 글자 상자 높이가 달라 같은 블록 안에서도 들쭉날쭉
+    steps = [a - c for a, c in zip(bases, bases[1:])]
+    pitch = sorted(x for x in steps if x >= 3.0)  # 같은 줄(위첨자 등 몇 pt 이내)·다음 단(음수) 제외
+    if not pitch: return t
+    line = pitch[len(pitch)//4]  # 하위 사분위 = 블록 안 줄 간격(블록이 짧아 간격 수가 많아도 안정)
+    gap = PDFIUM_BLOCK_GAP * line
+    cuts = [k for x, k in zip(steps, starts[1:]) if x > gap or x < -0.5 * line]  # 위로 반 줄 넘게 이동 = 다음 단 시작
+    if not cuts: return t
+    out, prev = [], 0
+    for k in cuts:
+        out.append(t[prev:k]); out.append("\n"); prev = k  # 블록 첫 줄 앞(직전 줄바꿈 뒤)에 줄바꿈 1개 추가
+    out.append(t[prev:])
+    return "".join(out)
+
+def _pdfium_text_upto_locked(b: bytes, max_chars: int) -> str:
+    pdf = pdfium.PdfDocument(b)
     try:
-        if pdf_extract_text is not None:
-            with io.BytesIO(b) as bio:
-                t = pdf_extract_text(bio) or ""
-        else:
+        parts, n = [], 0
+        for i in range(len(pdf)):
+            page = pdf[i]; tp = page.get_textpage()
+            try:
+                t = _pdfium_page_text(tp)
+            finally:
+                tp.close(); page.close()
+            parts.append(t); n += len(t) + 2
+            if n >= max_chars: break
+        # 페이지 경계는 pdfminer처럼 "\n\x0c" → 정규화 후 빈 줄로 남음
+        return "\n\x0c".join(parts).replace("\r\n", "\n").replace("\r", "\n")[:max_chars]
+    finally:
+        pdf.close()
+
+def extract_pdf_text(b: bytes, max_chars: int = PDF_MAX_CHARS) -> Tuple[str, bool, bool]:
+    """순수 추출(세션/UI 접근 없음 → 백그라운드 스레드에서도 사용). (정규화 텍스트, 상한 도달 여부, 스캔 PDF 추정)
+    pdfium 우선, 텍스트가 거의 없으면(특이 CMap 등) pdfminer로 한 번 더 시도.
+    스캔 판정은 추출 때 연 pdfium 문서 결과를 그대로 사용(진단용으로 PDF를 다시 파싱하지 않음)"""
+    t, opened = "", False
+    if pdfium is not None:
+        try:
+            t = _pdfium_text_upto(b, max_chars) or ""; opened = True
+        except Exception:
             t = ""
-    except Exception:
-        t = ""
-    t = normalize_text(t)
-    if len(t.strip()) < 10 and pdfium is not None:
+    if len(t.strip()) < 10 and HAS_PDFMINER:
         try:
             with io.BytesIO(b) as bio:
-                _ = pdfium.PdfDocument(bio)
-                if t.strip() == "":
-                    st.warning("⚠️ 이미지/스캔 PDF로 보입니다. 현재 OCR 미지원.")
+                t = _pdfminer_text_upto(bio, max_chars) or ""
         except Exception:
             pass
+    nt = normalize_text(t)
+    return nt, len(t) >= max_chars, opened and nt.strip() == ""
+
+@st.cache_data(max_entries=8, show_spinner="PDF 텍스트 추출 중...")
+def extract_pdf_text_cached(b: bytes, max_chars: int) -> Tuple[str, bool, bool]:
+    """화면 경로 전용 캐시(같은 파일이면 슬라이더/토글 재실행 때 재추출 안 함). 백그라운드 학습은 캐시를 거치지 않음.
+    스피너는 캐시 미스(실제 추출)일 때만 표시. 페이지별 진행률은 캐시 재생과 충돌(함수 밖 블록 갱신 불가)하므로 쓰지 않음"""
+    return extract_pdf_text(b, max_chars)
+
+def read_pdf_text_from_bytes(b: bytes, fname: str = "", max_chars: int = None) -> str:
+    if max_chars is None:
+        max_chars = int(st.session_state.get("pdf_max_chars") or PDF_MAX_CHARS)
+    t, truncated, scanned = extract_pdf_text_cached(b, max_chars)
+    if scanned:
+        st.warning("⚠️ 이미지/스캔 PDF로 보입니다. 현재 OCR 미지원.")
     st.session_state["last_file_diag"] = {
         "name": fname, "size_bytes": len(b), "extracted_chars": len(t),
-        "note": "empty_or_scanned" if (len(t.strip()) < 10) else "ok"
+        "note": "empty_or_scanned" if (len(t.strip()) < 10) else ("truncated" if truncated else "ok")
     }
     return t
 
 # -------------------- 요약/임베딩 유사도 유틸 --------------------
-def sentence_tfidf_vectors(sents: List[str], kb_boost: Dict[str, float] = None) -> Tuple[np.ndarray, List[str]]:
-    toks = [tokens(s) for s in sents]
+def sentence_tfidf_vectors(sents: List[str], kb_boost: Dict[str, float] = None, toks: List[List[str]] = None) -> Tuple[np.ndarray, List[str]]:
+    if toks is None: toks = [tokens(s) for s in sents]
     vocab: Dict[str,int] = {}
-    for ts in toks:
-        for t in ts:
-            if t not in vocab: vocab[t] = len(vocab)
+    cols = np.fromiter((vocab.setdefault(t, len(vocab)) for ts in toks for t in ts), dtype=np.int64)
     if not vocab:
         return np.zeros((len(sents),0), dtype=np.float32), []
-    M = np.zeros((len(sents), len(vocab)), dtype=np.float32)
-    df = np.zeros((len(vocab),), dtype=np.float32)
-    for i, ts in enumerate(toks):
-        for t in ts:
-            w = 1.0
-            if kb_boost and t in kb_boost: w *= kb_boost[t]
-            M[i, vocab[t]] += w
-        for t in set(ts):
-            df[vocab[t]] += 1.0
-    N = float(len(sents))
+    n, V = len(sents), len(vocab)
+    rows = np.repeat(np.arange(n), [len(ts) for ts in toks])
+    if kb_boost:
+        kbw = np.fromiter((kb_boost.get(t, np.nan) for t in vocab), dtype=np.float64, count=V)  # 어휘 1회 순회(NaN = KB 밖)
+        in_kb = ~np.isnan(kbw); boost = np.where(in_kb, kbw, 1.0).astype(np.float32)
+        w = boost[cols]
+    else:
+        w = None
+    if HAS_SCIPY and n*V >= SPARSE_MIN_CELLS:
+        M, keep = _tfidf_csr(rows, cols, w, n, V, boost if kb_boost else None, in_kb if kb_boost else None)
+        return M, [t for t, k in zip(vocab, keep) if k]
+    # 중복 (행, 열) 쌍을 np.unique로 합친 뒤 float32 행렬에 바로 흩뿌림(n×V float64/bool 임시 배열 없음)
+    flat = rows*V + cols
+    if w is None:
+        pairs, cnt = np.unique(flat, return_counts=True); vals = cnt.astype(np.float32)
+    else:
+        pairs, inv = np.unique(flat, return_inverse=True)
+        vals = np.bincount(inv, weights=w, minlength=len(pairs)).astype(np.float32)
+    pr, pc = np.divmod(pairs, V)
+    df = np.bincount(pc, minlength=V).astype(np.float32)  # 고유 쌍의 열 = 문장별 1회 등장
+    N = float(n)
     idf = np.log((N+1.0)/(df+1.0)) + 1.0
-    M *= idf
     if kb_boost:
-        for t, idx in vocab.items():
-            if t in kb_boost: M[:, idx] *= (1.0 + 0.2*kb_boost[t])
-    M /= (np.linalg.norm(M, axis=1, keepdims=True) + 1e-8)
-    return M, list(vocab.keys())
+        idf *= np.where(in_kb, 1.0 + 0.2*boost, 1.0).astype(np.float32)  # 열 가중을 길이 V 벡터에서 먼저 합침
+    vals *= idf[pc]
+    # 행 노름은 전체 어휘의 고유 쌍으로 구함(n×V 행렬 없이 bincount 1패스)
+    norm = np.sqrt(np.bincount(pr, weights=vals.astype(np.float64)**2, minlength=n)).astype(np.float32)
+    vals /= (norm + 1e-8)[pr]
+    # 문장 간 내적에 기여하지 않는 단독 어휘 열은 행렬을 만들기 전에 제외 → 코사인 값은 같고 메모리/X@Xᵀ 비용은 어휘 축소만큼 감소
+    keep = df >= SIM_MIN_DF
+    if keep.all():
+        Vk, terms = V, list(vocab.keys())
+    else:
+        sel = keep[pc]
+        pr, pc, vals = pr[sel], (np.cumsum(keep) - 1)[pc[sel]], vals[sel]
+        Vk, terms = int(keep.sum()), [t for t, k in zip(vocab, keep) if k]
+    M = np.zeros((n, Vk), dtype=np.float32); M[pr, pc] = vals
+    return M, terms
+
+def _tfidf_csr(rows, cols, w, n: int, V: int, boost=None, in_kb=None):
+    """sentence_tfidf_vectors의 희소(CSR) 버전 — 0이 아닌 칸만 저장/연산(메모리 n*V → nnz). (행렬, 남긴 열 마스크) 반환"""
+    from scipy import sparse as sp
+    data = np.ones(len(cols), dtype=np.float32) if w is None else w.astype(np.float32)
+    M = sp.csr_matrix((data, (rows, cols)), shape=(n, V), dtype=np.float32)
+    M.sum_duplicates()
+    df = np.bincount(M.indices, minlength=V).astype(np.float32)
+    idf = np.log((float(n)+1.0)/(df+1.0)) + 1.0
+    if boost is not None:
+        idf *= np.where(in_kb, 1.0 + 0.2*boost, 1.0).astype(np.float32)
+    M.data *= idf[M.indices]
+    row_of = np.repeat(np.arange(n), np.diff(M.indptr))
+    norm = np.sqrt(np.bincount(row_of, weights=M.data.astype(np.float64)**2, minlength=n)).astype(np.float32)
+    M.data /= (norm + 1e-8)[row_of]
+    keep = df >= SIM_MIN_DF  # 밀집 경로와 같은 어휘(단독 어휘 열 제거, 노름은 제거 전 기준)
+    if not keep.all():
+        M = M[:, keep]
+    return M, keep
+
+NUMBA_MIN_SENTS = 200  # 이 문장 수 이상에서만 JIT 커널 사용(소형 문서는 numpy가 더 빠름)
+
+@st.cache_resource(show_spinner=False)
+def _numba_textrank_kernel():
+    """numba TextRank 커널을 프로세스당 1회만 정의·예열(재실행마다 다시 만들지 않음). 실패 시 None"""
+    if njit is None:
+        return None
+    try:
+        @njit(fastmath=True)  # cache=True 금지(캐시 적재 시 app 모듈 import → 스크립트 재실행), parallel 금지(세션 스레드 동시 호출)
+        def textrank_k(PTd, tel, max_iter, tol):  # PTd = d·Pᵀ(감쇠 계수 선반영), tel = (1-d)/n
+            n = PTd.shape[0]
+            r = np.full(n, 1.0/n, dtype=np.float32); r2 = np.empty(n, dtype=np.float32)
+            for _ in range(max_iter):
+                for i in range(n):
+                    acc = 0.0
+                    for j in range(n): acc += PTd[i,j]*r[j]
+                    r2[i] = acc + tel
+                diff = 0.0
+                for i in range(n): diff += abs(r2[i]-r[i])  # L1 — numpy 경로와 같은 수렴 기준
+                r, r2 = r2, r
+                if diff < tol: break
+            return r
+
+        # 첫 사용자 요청이 컴파일 지연을 떠안지 않도록 2×2 입력으로 예열
+        textrank_k(np.zeros((2,2), dtype=np.float32), np.float32(0.075), 1, 1e-4)
+        return textrank_k
+    except Exception:
+        return None
+_numba_textrank_kernel()  # 프로세스 시작 시 1회 예열(이후 재실행은 캐시 적중)
 
 def cosim(X: np.ndarray) -> np.ndarray:
-    if X.size == 0: return np.zeros((X.shape[0], X.shape[0]), dtype=np.float32)
-    S = np.clip(X @ X.T, 0.0, 1.0); np.fill_diagonal(S, 0.0)
-    return S
+    if X.shape[1] == 0: return np.zeros((X.shape[0], X.shape[0]), dtype=np.float32)
+    G = X @ X.T
+    if not isinstance(G, np.ndarray): G = G.toarray()  # 희소(CSR) 입력 — 결과(n×n)는 작으므로 밀집
+    np.clip(G, 0.0, 1.0, out=G); np.fill_diagonal(G, 0.0)  # G는 새로 만든 배열 → 제자리 클립(n×n 추가 할당 없음)
+    return G
 
-def textrank_scores(sents: List[str], X: np.ndarray, d: float=0.85, max_iter: int=60, tol: float=1e-4) -> List[float]:
+def textrank_scores(sents: List[str], X: np.ndarray, d: float=0.85, max_iter: int=60, tol: float=1e-4, W: np.ndarray=None) -> List[float]:
     n = len(sents)
     if n == 0: return []
-    W = cosim(X); row = W.sum(axis=1, keepdims=True)
-    P = np.divide(W, row, out=np.zeros_like(W), where=row>0)
-    r = np.ones((n,1), dtype=np.float32)/n; tel = np.ones((n,1), dtype=np.float32)/n
+    if W is None: W = cosim(X)
+    # 행 정규화 P = W/행합 을 따로 만들지 않고 전치 버퍼에 바로 기록: PTd[j,i] = d·W[i,j]/행합[i]
+    # (W는 rank_doc 캐시·MMR과 공유하므로 제자리 변경 금지 → n×n 할당은 PTd 1개뿐)
+    row = W.sum(axis=1).reshape(1, n)
+    PTd = np.zeros_like(W); np.divide(W.T, row, out=PTd, where=row>0); PTd *= np.float32(d)
+    tel = np.float32((1-d)/n)
+    if n >= NUMBA_MIN_SENTS:
+        textrank_k = _numba_textrank_kernel()
+        if textrank_k is not None:
+            return textrank_k(PTd, tel, max_iter, tol).tolist()
+    r = np.full(n, 1.0/n, dtype=np.float32); r2 = np.empty_like(r); diff = np.empty_like(r)
     for _ in range(max_iter):
-        r2 = d*(P.T @ r) + (1-d)*tel
-        if np.linalg.norm(r2-r,1) < tol: r = r2; break
-        r = r2
-    return [float(v) for v in r.flatten()]
-
-def mmr_select(sents: List[str], scores: List[float], X: np.ndarray, k: int, lam: float=0.7) -> List[int]:
-    S = cosim(X); sel: List[int] = []; rem = set(range(len(sents)))
-    while rem and len(sel) < k:
-        best, val = None, -1e9
-        for i in rem:
-            rel = scores[i]; div = max((S[i,j] for j in sel), default=0.0)
-            sc = lam*rel - (1-lam)*div
-            if sc > val: val, best = sc, i
-        sel.append(best); rem.remove(best)
+        np.dot(PTd, r, out=r2); r2 += tel  # float32 일관 → sgemv
+        np.subtract(r2, r, out=diff); np.abs(diff, out=diff)
+        done = float(diff.sum()) < tol  # L1 수렴 판정(기존 기준 유지, 임시 배열 없음)
+        r, r2 = r2, r  # 버퍼 교체(재할당 없음)
+        if done: break
+    return r.tolist()  # 1차원 버퍼 → 평탄화 복사 없이 파이썬 float 목록
+
+def mmr_select(sents: List[str], scores: List[float], X: np.ndarray, k: int, lam: float=0.7, S: np.ndarray=None) -> List[int]:
+    if S is None: S = cosim(X)
+    n = len(sents); rel = lam*np.asarray(scores, dtype=np.float64)  # 선택된 문장은 rel=-inf로 표시(별도 마스크 없음)
+    max_sim = np.zeros(n, dtype=np.float64)  # 선택 집합과의 최대 유사도(선택 시마다 갱신)
+    mmr = np.empty(n, dtype=np.float64); div = -(1-lam); sel: List[int] = []
+    for _ in range(min(k, n)):
+        np.multiply(max_sim, div, out=mmr); mmr += rel  # rel - (1-λ)·max_sim, 반복마다 임시 배열 없음
+        best = int(mmr.argmax())  # 동점이면 가장 앞 문장(기존 순회 순서와 동일)
+        sel.append(best); rel[best] = -np.inf
+        np.maximum(max_sim, S[:, best], out=max_sim)
     return sel
 
-def ai_extract_summary(text: str, limit: int=8) -> List[str]:
-    sents = preprocess_text_to_sentences(text)
-    if not sents: return []
-    kb = st.session_state["kb_terms"]; total = sum(kb.values()) or 1
-    kb_boost = {t: 1.0 + (cnt/total)*3.0 for t, cnt in kb.items()} if kb else None
-    X, _ = sentence_tfidf_vectors(sents, kb_boost=kb_boost)
-    scores = textrank_scores(sents, X)
-    idx = mmr_select(sents, scores, X, limit, lam=0.7)
+def rank_doc(text: str) -> Tuple[List[str], np.ndarray, List[float]]:
+    """(문장, 유사도 행렬 W, TextRank 점수) — TF-IDF·W는 1회만 계산해 TextRank/MMR이 공유.
+    limit과 무관하므로 (문서, kb_rev) 단위로 캐시 → 요약 강도 슬라이더만 바꾸면 MMR만 다시 수행"""
+    def _build():
+        sents, toks = tokenize_doc(text)
+        if not sents: return sents, np.zeros((0, 0), dtype=np.float32), []
+        X, _ = sentence_tfidf_vectors(sents, kb_boost=kb_boost_map() or None, toks=toks)
+        W = cosim(X)
+        return sents, W, textrank_scores(sents, X, W=W)
+    return session_lru("_rank_cache", (text_digest(text), st.session_state["kb_rev"]), _build, 4)
+
+def _ai_extract_summary(text: str, limit: int) -> List[str]:
+    sents = tokenize_doc(text)[0]
+    if len(sents) <= limit: return list(sents)  # 전부 선택될 문서는 TF-IDF/TextRank/MMR 없이 원문 순서 그대로
+    sents, W, scores = rank_doc(text)
+    idx = mmr_select(sents, scores, None, limit, lam=0.7, S=W)
     return [sents[i] for i in idx]
 
+def ai_extract_summary(text: str, limit: int=8) -> List[str]:
+    """(문서 다이제스트, limit, kb_rev) 단위로 재실행 간 캐시 — KB가 바뀌면 kb_rev로 자동 무효화"""
+    key = (text_digest(text), limit, st.session_state["kb_rev"])
+    return list(session_lru("_summary_cache", key, lambda: _ai_extract_summary(text, limit), 16))
+
 # -------------------- 도메인 템플릿/자연화 --------------------
 def jaccard(a: set, b: set) -> float:
     return len(a & b) / (len(a | b) + 1e-8)
@@ -596,9 +871,14 @@ DOMAIN_TEMPLATES = [
     ({"컨베이어","협착","회전체"}, "회전체·물림점 접촉을 방지하도록 방호장치를 설치하고 점검합니다."),
 ]
 
+@lru_cache(maxsize=4)
+def _doc_token_set(text: str) -> frozenset:
+    """문서 전체 토큰 집합 — 행동문 변환 문장마다 원문 전체를 다시 토큰화하지 않도록 문서당 1회"""
+    return frozenset(tokens(text))
+
 def _domain_template_apply(s: str, base_text: str) -> str:
     if not st.session_state.get("domain_toggle"): return s
-    sent_toks = set(tokens(s)); base_toks = set(tokens(base_text))
+    sent_toks = set(tokens(s)); base_toks = _doc_token_set(base_text)
     if jaccard(sent_toks, base_toks) < 0.05: return s
     best = None; best_hits = 0
     for triggers, render in DOMAIN_TEMPLATES:
@@ -607,45 +887,76 @@ def _domain_template_apply(s: str, base_text: str) -> str:
             if hits > best_hits: best_hits = hits; best = render
     return best if best else s
 
+_LEAD_PAREN_RE = re.compile(r"^\(([^)]+)\)\s*")
+_META_RES = tuple(re.compile(p) for p in META_PATTERNS)
+_POLITE_ONLY_RE = re.compile(r"[가-힣\s]*합니다\.")
+# 키워드 포함 판정은 any(w in s …) 대신 컴파일된 교대식 1회 search(문장당 최대 14회 → 1회 스캔)
+_NOT_CASE_RE = re.compile("예방|대책|지침|수칙|안전조치|작업방법|허가|감시자|점검|차단|설치|준수|배치")
+_PREV_WORD_RE = re.compile("예방|대책|지침|수칙|안전조치|작업방법")
+_RISK_WORD_RE = re.compile("위험|요인|원인|증상|결빙|강풍|폭염|미세먼지|회전체|비산|말림|추락|낙하|협착")
+_VERBISH_RE = re.compile("합니다|한다|실시|설치|착용|점검|확인|배치|가동|연결|해제|정지")
+_ASK_RE = re.compile(r"\?|확인|점검")
+_PROMO_SRC_RE = re.compile("OPS|VR|공단")
+_KM_COMMON_RE = re.compile("철저|작업방법|안전작업방법|허가|감시자|점검|설치|준수")
+
+@lru_cache(maxsize=4096)  # 순수 함수 — 같은 문장이 요약/분류/행동문 변환에서 반복 호출됨(생성 1회 53회 중 고유 22개)
 def soften(s: str) -> str:
-    s = s.replace("하여야","해야 합니다").replace("한다","합니다").replace("한다.","합니다.")
-    s = s.replace("바랍니다","해주세요").replace("확인 바람","확인해주세요")
-    s = s.replace("금지한다","금지합니다").replace("필요하다","필요합니다")
-    s = re.sub(r"^\(([^)]+)\)\s*","", s)
-    for pat in META_PATTERNS:
-        s = re.sub(pat,"", s).strip()
-    s = re.sub(BULLET_PREFIX,"", s).strip(" -•●\t")
-    s = re.sub(r"\(\s*\)", "", s)
-    s = re.sub(r"(스마트폰\s*APP|애플리케이션)", "", s)
+    # str.replace 연쇄가 콜백 정규식 치환보다 빠름(측정). "한다."/"금지한다"는 "한다" 치환 뒤라 항상 무효였으므로 제거
+    s = s.replace("하여야","해야 합니다").replace("한다","합니다")
+    s = s.replace("바랍니다","해주세요").replace("확인 바람","확인해주세요").replace("필요하다","필요합니다")
+    s = _LEAD_PAREN_RE.sub("", s)
+    for pat in _META_RES:
+        s = pat.sub("", s).strip()
+    s = _BULLET_RE.sub("", s).strip(" -•●\t")
+    s = _EMPTY_PAREN_RE.sub("", s)
+    s = _APP_RE.sub("", s)
     s = tidy_korean_spaces(s)
     return s
 
 def is_meaningful_sentence(s: str) -> bool:
-    raw = re.sub(r"\s+","", s)
-    if len(raw) < 4: return False
-    if re.fullmatch(r"[가-힣\s]*합니다\.", s.strip()): return False
+    if len(s.translate(_WS_TABLE)) < 4: return False
+    if _POLITE_ONLY_RE.fullmatch(s.strip()): return False
     return True
 
 def is_accident_sentence(s: str) -> bool:
-    if any(w in s for w in ["예방","대책","지침","수칙","안전조치","작업방법","허가","감시자","점검","차단","설치","준수","배치"]):
+    if _NOT_CASE_RE.search(s):
         return False
-    return bool(re.search(DATE_PAT, s) or re.search(ACCIDENT_PAT, s))
+    return bool(_DATE_RE.search(s) or _ACCIDENT_RE.search(s))
 
 def is_prevention_sentence(s: str) -> bool:
-    return any(w in s for w in ["예방","대책","지침","수칙","안전조치","작업방법"]) or bool(re.search(ACTION_PAT, s))
+    return bool(_PREV_WORD_RE.search(s) or _ACTION_RE.search(s))
 
 def is_risk_sentence(s: str) -> bool:
-    return any(w in s for w in ["위험","요인","원인","증상","결빙","강풍","폭염","미세먼지","회전체","비산","말림","추락","낙하","협착"])
+    return bool(_RISK_WORD_RE.search(s))
+
+_ACT_PRE_RES = (
+    (re.compile(r"\s*에\s*따른\s*"), " 시 "),
+    (re.compile(r"\s*에\s*따라\s*"), " 시 "),
+)
+_ACT_REMOVE_BLOCK_RE = re.compile(r"(?P<obj>[\w가-힣·\(\)\[\]\/\- ]{2,})\s*제거\s*및\s*차단")
+_ACT_POST_RES = (
+    (re.compile(r"작동을\s*설치"), "작동하도록"),
+    (re.compile(r"\b반드시를\b"), "반드시"),
+)
+_CAMPAIGN_RE = re.compile(r"(위기탈출\s*안전보건)")
+_NOUN_TAIL_RE = re.compile(r"(의|에|에서|을|를|와|과|및)$")
+_OBJ_PARTICLE_END_RE = re.compile(r"(을|를)$")
+_CORE_FIX_RES = (
+    (re.compile(r"하고를\s+차단"), "하고 차단"),
+    (re.compile(r"\s+(를|을)\s+(를|을)\s+"), " 를 "),
+    (re.compile(r"(작업\s*전\s*){2,}"), "작업 전 "),
+    (re.compile(r"(반드시\s*){2,}"), "반드시 "),
+)
+_INSTALL_OBJ_RE = re.compile("난간|방호망|발판|방호장치|장비|장치|표지|누전차단기|보호망|커버")
+_EMPTY_CORE_RE = re.compile(r"(반드시 |작업 전 )?\s*(을|를)\s*(실시|관리|운영)\s*$")
 
 def to_action_sentence(s: str, base_text: str) -> str:
     s2 = soften(s)
-    s2 = re.sub(r"(위기탈출\s*안전보건)", "", s2).strip()
-    s2 = re.sub(r"\s*에\s*따른\s*", " 시 ", s2)
-    s2 = re.sub(r"\s*에\s*따라\s*", " 시 ", s2)
-    s2 = re.sub(r"(?P<obj>[\w가-힣·\(\)\[\]\/\- ]{2,})\s*제거\s*및\s*차단", lambda m: add_obj_particle(m.group('obj').strip()) + " 제거하고 차단", s2)
-    s2 = re.sub(r"작동을\s*설치", "작동하도록", s2)
-    s2 = re.sub(r"\b반드시를\b", "반드시", s2)
-    s2 = re.sub(r"\(\s*\)", "", s2)
+    s2 = _CAMPAIGN_RE.sub("", s2).strip()
+    for pat, rep in _ACT_PRE_RES: s2 = pat.sub(rep, s2)
+    s2 = _ACT_REMOVE_BLOCK_RE.sub(lambda m: add_obj_particle(m.group('obj').strip()) + " 제거하고 차단", s2)
+    for pat, rep in _ACT_POST_RES: s2 = pat.sub(rep, s2)
+    s2 = _EMPTY_PAREN_RE.sub("", s2)
 
     s2_tpl = _domain_template_apply(s2, base_text)
     if s2_tpl != s2:
@@ -653,26 +964,23 @@ def to_action_sentence(s: str, base_text: str) -> str:
         if not txt.endswith(("다.","합니다.","습니다.")):
             txt = txt.rstrip(" .") + " 합니다."
         return tidy_korean_spaces(txt)
-    m = re.search(ACTION_PAT, s2)
+    m = _ACTION_RE.search(s2)
     if not m:
-        nounish = re.sub(r"(의|에|에서|을|를|와|과|및)$","", s2).strip()
+        nounish = _NOUN_TAIL_RE.sub("", s2).strip()
         if nounish and len(nounish) >= 4:
-            guess_verb = "설치" if any(k in nounish for k in ["난간","방호망","발판","방호장치","장비","장치","표지","누전차단기","보호망","커버"]) else "확인"
+            guess_verb = "설치" if _INSTALL_OBJ_RE.search(nounish) else "확인"
             obj = add_obj_particle(nounish)
             return tidy_korean_spaces(f"{obj} {guess_verb} 합니다.")
         txt = s2 if s2.endswith(("니다.","합니다.","다.")) else (s2.rstrip(" .") + " 합니다.")
         return tidy_korean_spaces(txt)
     obj = (m.group("obj") or m.group("obj2") or "").strip()
     verb = (m.group("verb") or m.group("verb2") or "실시").strip()
-    if obj and not re.search(r"(을|를)$", obj) and not obj.endswith("및"):
+    if obj and not _OBJ_PARTICLE_END_RE.search(obj) and not obj.endswith("및"):
         obj = add_obj_particle(obj)
     prefix = "반드시 " if "설치" in verb else ("작업 전 " if verb in ("확인","점검","측정","기록","작성","지정","연결","해제") else "")
     core = tidy_korean_spaces(f"{prefix}{obj} {verb}")
-    core = re.sub(r"하고를\s+차단", "하고 차단", core)
-    core = re.sub(r"\s+(를|을)\s+(를|을)\s+", " 를 ", core)
-    core = re.sub(r"(작업\s*전\s*){2,}", "작업 전 ", core)
-    core = re.sub(r"(반드시\s*){2,}", "반드시 ", core)
-    if re.fullmatch(r"(반드시 |작업 전 )?\s*(을|를)\s*(실시|관리|운영)\s*$", core):
+    for pat, rep in _CORE_FIX_RES: core = pat.sub(rep, core)
+    if _EMPTY_CORE_RE.fullmatch(core):
         if obj.strip():
             core = tidy_korean_spaces(f"{prefix}{obj} 실시")
         else:
@@ -684,15 +992,15 @@ def repair_action_fragments(lines: List[str]) -> List[str]:
     i = 0
     while i < len(lines):
         cur = soften(lines[i])
-        cur_no_sp = re.sub(r"\s+","", cur)
-        has_verb = bool(re.search(ACTION_PAT, cur)) or any(v in cur for v in ["합니다","한다","실시","설치","착용","점검","확인","배치","가동","연결","해제","정지"])
+        cur_no_sp = cur.translate(_WS_TABLE)
+        has_verb = bool(_ACTION_RE.search(cur) or _VERBISH_RE.search(cur))
         if (len(cur_no_sp) < 20) and (not has_verb):
             merged = cur
             j = i + 1
             while j < len(lines):
                 nxt = soften(lines[j])
                 merged = tidy_korean_spaces(merged + " " + nxt)
-                if re.search(ACTION_PAT, merged) or any(v in merged for v in ["합니다","한다","실시","설치","착용","점검","확인","배치","가동","연결","해제","정지"]):
+                if _ACTION_RE.search(merged) or _VERBISH_RE.search(merged):
                     break
                 j += 1
             out.append(merged); i = j + 1
@@ -701,79 +1009,170 @@ def repair_action_fragments(lines: List[str]) -> List[str]:
     return out
 
 # -------------------- KB(세션 동적 “경량 학습”) --------------------
+@st.cache_resource(show_spinner=False)
+def _seed_kb_snapshot() -> Tuple[Tuple[str, ...], Tuple[str, ...], Dict[str, int]]:
+    """정적 시드 KB를 정규화한 스냅샷 — 프로세스당 1회 생성, 세션에는 사본만 넣음"""
+    actions = tuple(a if a.endswith(("다","다.","합니다","합니다.")) else a + " 합니다." for a in SEED_ACTIONS if 2 <= len(a) <= 160)
+    questions = tuple(q if q.endswith("?") else q + "?" for q in SEED_QUESTIONS)
+    return actions, questions, dict.fromkeys(SEED_RISK_MAP, 5)
+
 def seed_kb_once():
-    if not st.session_state["seed_loaded"]:
-        for t, k in SEED_RISK_MAP.items():
-            if t not in RISK_KEYWORDS: RISK_KEYWORDS[t] = k
-        for a in SEED_ACTIONS:
-            if 2 <= len(a) <= 160:
-                st.session_state["kb_actions"].append(a if a.endswith(("다","다.","합니다","합니다.")) else a + " 합니다.")
-        for q in SEED_QUESTIONS:
-            st.session_state["kb_questions"].append(q if q.endswith("?") else q + "?")
-        for t in SEED_RISK_MAP.keys():
-            st.session_state["kb_terms"][t] += 5
-        st.session_state["seed_loaded"] = True
+    # 시드 위험어는 risk_keywords()가 SEED_RISK_MAP에서 직접 합치므로 별도 반영 불필요
+    ss = st.session_state
+    if not ss["seed_loaded"]:
+        actions, questions, terms = _seed_kb_snapshot()
+        ss["kb_actions"].extend(actions)
+        ss["kb_questions"].extend(questions)
+        ss["kb_terms"].update(terms)
+        ss["seed_loaded"] = True
+        ss["kb_rev"] += 1
+
+def _kb_worker() -> Tuple[ThreadPoolExecutor, threading.Lock]:
+    """세션 전용 KB 학습 워커(1개) + KB 변경 잠금 — 재실행마다 새로 만들지 않고, 다른 세션의 학습 대기열에 막히지 않음.
+    프로세스 공용이 필요한 PDFium 접근은 _pdfium_lock이 따로 직렬화"""
+    ss = st.session_state
+    if "_kb_worker" not in ss:
+        ss["_kb_worker"] = (ThreadPoolExecutor(max_workers=1, thread_name_prefix="kb_ingest"), threading.Lock())
+    return ss["_kb_worker"]
 
 def kb_ingest_text(text: str) -> None:
     if not (text or "").strip(): return
+    with _kb_worker()[1]:
+        _kb_ingest_locked(text)
+
+_RISK_TERM_RE = re.compile(r"(추락|낙하|깔림|끼임|중독|질식|화재|폭발|감전|폭염|붕괴|비계|갱폼|예초|벌목|컨베이어|크레인|지붕|선반|천공|화학물질|밀폐공간)")
+
+def _kb_ingest_locked(text: str) -> None:
+    # 학습 전용 호출은 캐시를 쓰지 않음(ZIP 일괄 학습이 편집 중 문서 캐시를 밀어내지 않도록)
+    ss = st.session_state  # 프록시 접근은 1회만, 이후 로컬 바인딩으로 일괄 반영
     sents = preprocess_text_to_sentences(text)
-    for s in sents:
-        for t in tokens(s):
-            if len(t) >= 2:
-                st.session_state["kb_terms"][t] += 1
-                if re.search(r"(추락|낙하|깔림|끼임|중독|질식|화재|폭발|감전|폭염|붕괴|비계|갱폼|예초|벌목|컨베이어|크레인|지붕|선반|천공|화학물질|밀폐공간)", t):
-                    if t not in RISK_KEYWORDS: RISK_KEYWORDS[t] = t
-    action_candidates = [s for s in sents if (re.search(ACTION_PAT, s) or is_prevention_sentence(s))]
+    terms = [t for s in sents for t in tokens(s) if len(t) >= 2]
+    ss["kb_terms"].update(terms)
+    learned = ss["kb_risk_terms"]
+    for t in dict.fromkeys(terms):
+        if t not in SEED_RISK_MAP and t not in learned and _RISK_TERM_RE.search(t): learned[t] = t
+    action_candidates = [s for s in sents if (_ACTION_RE.search(s) or is_prevention_sentence(s))]
     action_candidates = repair_action_fragments(action_candidates)
-    for s in action_candidates:
-        cand = to_action_sentence(s, text)
-        if 2 <= len(cand) <= 180:
-            st.session_state["kb_actions"].append(cand)
+    new_actions = [c for c in (to_action_sentence(s, text) for s in action_candidates) if 2 <= len(c) <= 180]
+    ss["kb_actions"].extend(new_actions)
+    new_questions = []
     for s in sents:
-        if "?" in s or "확인" in s or "점검" in s:
-            if not re.search(r"(OPS|VR|공단)", s):
+        if _ASK_RE.search(s):
+            if not _PROMO_SRC_RE.search(s):
                 q = soften(s if s.endswith("?") else s + " 맞습니까?")
                 if 2 <= len(q) <= 160:
-                    st.session_state["kb_questions"].append(q)
+                    new_questions.append(q)
+    ss["kb_questions"].extend(new_questions)
+    ss["kb_rev"] += 1
 
 def kb_prune() -> None:
-    def dedup_keep_order(lst: List[str]) -> List[str]:
-        seen, out = set(), []
-        for x in lst:
-            k = re.sub(r"\s+","", x)
-            if k not in seen:
-                seen.add(k); out.append(x)
-        return out
-    st.session_state["kb_actions"]   = dedup_keep_order(st.session_state["kb_actions"])[:2000]
-    st.session_state["kb_questions"] = dedup_keep_order(st.session_state["kb_questions"])[:800]
-    st.session_state["kb_terms"]     = Counter(dict(st.session_state["kb_terms"].most_common(4000)))
-
-def kb_match_candidates(cands: List[str], base_text: str, limit: int, min_sim: float = 0.12) -> List[str]:
-    bt = set(tokens(base_text))
-    present_risks = {t for t in bt if (t in RISK_KEYWORDS or t in RISK_KEYWORDS.values())}
+    with _kb_worker()[1]:
+        st.session_state["kb_actions"]   = uniq_keep(st.session_state["kb_actions"])[:2000]
+        st.session_state["kb_questions"] = uniq_keep(st.session_state["kb_questions"])[:800]
+        st.session_state["kb_terms"]     = Counter(dict(st.session_state["kb_terms"].most_common(4000)))
+        st.session_state["kb_rev"] += 1
+
+def kb_boost_map() -> Dict[str, float]:
+    """KB 용어 가중치(1 + 3·빈도비율) — kb_rev 단위로 1회만 계산, 같은 KB로 여러 문서를 요약할 때 재사용"""
+    def _build():
+        kb = st.session_state["kb_terms"]; total = sum(kb.values()) or 1
+        return {t: 1.0 + (cnt/total)*3.0 for t, cnt in kb.items()}
+    return session_lru("_kb_boost_cache", st.session_state["kb_rev"], _build, 1)
+
+def risk_keywords() -> Tuple[Dict[str, str], frozenset]:
+    """위험어 → 대표 위험 매핑(시드 + 세션 학습분)과 키·값 합집합 — kb_rev 단위로 1회만 합침"""
+    def _build():
+        m = {**SEED_RISK_MAP, **st.session_state["kb_risk_terms"]}
+        return m, frozenset(m) | frozenset(m.values())
+    return session_lru("_risk_kw_cache", st.session_state["kb_rev"], _build, 1)
+
+def _kb_task(ctx, source) -> None:
+    add_script_run_ctx(threading.current_thread(), ctx)  # 워커에서도 해당 세션의 session_state 사용
+    text = source() if callable(source) else source
+    if (text or "").strip():
+        kb_ingest_text(text); kb_prune()
+
+def kb_ingest_async(key: str, source) -> None:
+    """학습을 백그라운드 워커에 제출(source: 텍스트 또는 텍스트를 돌려주는 함수). 같은 key는 세션당 1회만"""
+    seen = st.session_state.setdefault("_kb_seen", set())  # 이미 학습(또는 제출)한 입력은 재실행마다 다시 학습하지 않음
+    if key in seen: return
+    seen.add(key)
+    st.session_state.setdefault("_kb_pending", {})[key] = _kb_worker()[0].submit(_kb_task, get_script_run_ctx(), source)
+
+def _kb_collect(pending: Dict) -> None:
+    """끝난 학습 결과를 회수하고 목록을 비움(실패한 입력은 경고 후 _kb_seen에서 빼 다음 재실행에서 다시 학습)"""
+    seen = st.session_state.get("_kb_seen") or set()
+    for key, f in list(pending.items()):
+        try:
+            f.result()
+        except Exception as e:
+            seen.discard(key)
+            st.warning(f"⚠️ KB 학습 실패({key}): {e}")
+    pending.clear()
+
+def kb_wait() -> None:
+    """대본 생성/초기화 직전: 대기 중인 학습을 모두 반영"""
+    _kb_collect(st.session_state.get("_kb_pending") or {})
+
+@st.fragment(run_every=1.0)
+def _kb_progress_fragment() -> None:
+    """진행 중인 동안 이 조각만 1초마다 다시 그림 — 모두 끝나면 앱 전체를 1회 재실행해 폴링 종료"""
+    pending = st.session_state.get("_kb_pending") or {}
+    done = sum(1 for f in pending.values() if f.done())
+    if done == len(pending):
+        st.rerun()
+    st.status(f"학습 진행 {done}/{len(pending)} (백그라운드)", state="running")
+
+def kb_progress_note() -> None:
+    pending = st.session_state.get("_kb_pending") or {}
+    if not pending: return
+    if all(f.done() for f in pending.values()):
+        st.status(f"학습 완료 {len(pending)}건", state="complete")
+        _kb_collect(pending)  # 완료 표시는 1회만 — 다음 재실행부터는 표시 안 함
+    else:
+        _kb_progress_fragment()
+
+def _kb_token_sets(kind: str) -> List[Tuple[str, frozenset]]:
+    """KB 후보(kind: "kb_actions"/"kb_questions")별 토큰 집합 — 최대 2000개를 생성마다 다시 토큰화하지 않도록 kb_rev당 1회"""
+    def _build():
+        return [(c, frozenset(tokens(c))) for c in st.session_state[kind]]
+    return session_lru("_kb_tok_cache", (kind, st.session_state["kb_rev"]), _build, 2)
+
+def kb_match_candidates(kind: str, base_text: str, limit: int, min_sim: float = 0.12) -> List[str]:
+    bt = _doc_token_set(base_text); nb = len(bt)
+    risk_map, risk_terms = risk_keywords()
+    present_risks = bt & risk_terms
     scored: List[Tuple[float,str]] = []
-    commons = {"철저","작업방법","안전작업방법","허가","감시자","점검","설치","준수"} if st.session_state.get("profile_km") else set()
-    for c in cands:
-        if any(w in c for w in commons):
+    km = st.session_state.get("profile_km")
+    for c, ct in _kb_token_sets(kind):  # KB 후보(최대 2000개)마다 키워드 판정은 컴파일된 교대식 1회씩
+        if min_sim > 0 and bt.isdisjoint(ct):  # 겹치는 토큰이 없으면 유사도 0 → 정규식/위험 판정 전에 제외
+            continue
+        if km and _KM_COMMON_RE.search(c):
             continue
-        if re.search(r"(OPS|VR|공단)", c):
+        if _PROMO_SRC_RE.search(c):
             continue
-        ct = set(tokens(c))
-        cand_risks = {RISK_KEYWORDS.get(t, t) for t in ct if (t in RISK_KEYWORDS or t in RISK_KEYWORDS.values())}
+        cand_risks = {risk_map.get(t, t) for t in ct & risk_terms}
         if cand_risks and not (cand_risks & present_risks):
             continue
-        j = len(bt & ct) / (len(bt | ct) + 1e-8)
+        inter = len(bt & ct)
+        j = inter / (nb + len(ct) - inter + 1e-8)  # |A∪B| = |A|+|B|-|A∩B| (문서 전체 합집합을 만들지 않음)
         if j >= min_sim:
             scored.append((j, c))
-    scored.sort(key=lambda x: x[0], reverse=True)
-    return [c for _, c in scored[:limit]]
+    # 상위 limit개만 필요 → 힙 top-k(sorted(..., reverse=True)[:limit]와 같은 결과·동점 순서)
+    return [c for _, c in heapq.nlargest(limit, scored, key=lambda x: x[0])]
 
 # -------------------- 사례/예방 자연화 보조 --------------------
+_DEATH_RE = re.compile(r"사망\s*(\d+)\s*명")
+_INJ_RE = re.compile(r"사상\s*(\d+)\s*명")
+_CASE_END_RE = re.compile(r"(다\.|입니다\.|사고가 발생했습니다\.)$")
+_ACC_TAIL_RE = re.compile(ACCIDENT_PAT + r"\s*$")
+_EVENT_TAIL_RE = re.compile(r"(사건|사고)\s*$")
+
 def naturalize_case_sentence(s: str) -> str:
     s = soften(s)
-    death = re.search(r"사망\s*(\d+)\s*명", s)
-    inj = re.search(r"사상\s*(\d+)\s*명", s)
-    unconscious = re.search(r"의식불명", s)
+    death = _DEATH_RE.search(s)
+    inj = _INJ_RE.search(s)
+    unconscious = "의식불명" in s
     info = []
     if death:
         info.append(f"근로자 {death.group(1)}명 사망")
@@ -781,7 +1180,7 @@ def naturalize_case_sentence(s: str) -> str:
         info.append(f"{inj.group(1)}명 사상")
     if unconscious:
         info.append("의식불명 발생")
-    m = re.search(DATE_PAT, s)
+    m = _DATE_RE.search(s)
     date_txt = ""
     if m:
         y, mo, d = m.groups()
@@ -790,10 +1189,10 @@ def naturalize_case_sentence(s: str) -> str:
         date_txt = f"{int(y)}년 {int(mo)}월 {int(d)}일, "
         s = s.replace(m.group(0), "").strip()
     s = s.strip(" ,.-")
-    if not re.search(r"(다\.|입니다\.|사고가 발생했습니다\.)$", s):
-        if re.search(ACCIDENT_PAT + r"\s*$", s):
+    if not _CASE_END_RE.search(s):
+        if _ACC_TAIL_RE.search(s):
             s = s.rstrip(" .") + " 사고가 발생했습니다."
-        elif re.search(r"(사건|사고)\s*$", s):
+        elif _EVENT_TAIL_RE.search(s):
             s = s.rstrip(" .") + "가 발생했습니다."
         else:
             s = s.rstrip(" .") + " 사고가 발생했습니다."
@@ -808,17 +1207,9 @@ def fallback_extract_cases(text: str, sents: List[str]) -> List[str]:
     from_sents = [x for x in sents if is_accident_sentence(x)]
     pool = from_cluster + from_sents
     pool = stitch_case_blocks(pool)
-    seen, out = set(), []
-    for x in pool:
-        # 날짜 패턴이 두 번 이상 나타나면(= 서로 다른 사고가 한 문장에 섞인 경우) 제외
-        if len(re.findall(DATE_PAT, x)) > 1:
-            continue
-
-        k = re.sub(r"\s+","", x)
-        if k not in seen:
-            seen.add(k)
-            out.append(x)
-    return out[:6]
+    # 날짜 패턴이 두 번 이상 나타나면(= 서로 다른 사고가 한 문장에 섞인 경우) 제외
+    pool = [x for x in pool if len(_DATE_RE.findall(x)) <= 1]
+    return uniq_keep(pool)[:6]
 
 
 def fallback_extract_preventions(text: str, sents: List[str]) -> List[str]:
@@ -831,53 +1222,51 @@ def fallback_extract_preventions(text: str, sents: List[str]) -> List[str]:
     pool = [p for p in pool if not promo_pat.search(p)]
     pool = repair_action_fragments(pool)
     norm = [y for y in (to_action_sentence(x, text) for x in pool if is_meaningful_sentence(x)) if y]
-    seen, out = set(), []
-    for x in norm:
-        k = re.sub(r"\s+","", x)
-        if k not in seen:
-            seen.add(k)
-            out.append(x)
-    return out[:12]
+    return uniq_keep(norm)[:12]
 
 
 # -------------------- 라벨링 --------------------
-def drop_label_token(t: str) -> bool:
-    if t in STOP_TERMS: return True
-    for pat in LABEL_DROP_PAT:
-        if re.match(pat, t): return True
-    if t in {"소재","소재지","지역","장소","버스","영업소","업체","자료","키","메세지","명","안전보건"}:
-        return True
-    if st.session_state.get("profile_km") and t in {"철저","작업방법","안전작업방법","허가","감시자","설치","준수","콘텐츠","동영상","숏츠","그림파일","텍스트"}:
-        return True
-    return False
+_LABEL_DROP_RE = re.compile("|".join(f"(?:{p})" for p in LABEL_DROP_PAT))
+LABEL_DROP_WORDS = frozenset({"소재","소재지","지역","장소","버스","영업소","업체","자료","키","메세지","명","안전보건"})
+LABEL_KM_WORDS = frozenset({"철저","작업방법","안전작업방법","허가","감시자","설치","준수","콘텐츠","동영상","숏츠","그림파일","텍스트"})
+LABEL_COMMONS = frozenset({"안전","교육","작업","현장","예방","조치","확인","관리","점검","가이드","지침"})
+LABEL_ACTIONS = frozenset(["설치","배치","착용","점검","확인","측정","기록","표시","제공","비치","보고","신고","교육","주지","중지","통제","휴식","환기","차단","교대","배제","배려","가동","준수","운영","유지","교체","정비","청소","고정","격리","보호","보수","작성","지정","실시","연결","해제","정지","부착"])
+
+def drop_label_token(t: str, km: bool = None) -> bool:
+    if t in STOP_TERMS or t in LABEL_DROP_WORDS: return True
+    if _LABEL_DROP_RE.match(t): return True
+    if km is None: km = st.session_state.get("profile_km")
+    return bool(km) and t in LABEL_KM_WORDS
+
+def _kb_label_weights(km) -> List[Tuple[str, float]]:
+    """라벨용 KB 가중(0.2·빈도, 불용어 제외) — KB 최대 4000개 용어의 불용어 판정을 (kb_rev, 모드)당 1회만"""
+    def _build():
+        return [(t, 0.2 * c) for t, c in st.session_state["kb_terms"].items() if not drop_label_token(t, km)]
+    return session_lru("_kb_label_cache", (st.session_state["kb_rev"], bool(km)), _build, 2)
 
 def top_terms_for_label(text: str, k: int=3) -> List[str]:
-    doc_cnt = Counter([t for t in tokens(text) if not drop_label_token(t)])
+    km = st.session_state.get("profile_km")
+    # 빈도를 먼저 세고 고유 토큰만 불용어 판정(등장 횟수만큼 정규식 검사하지 않음, 첫 등장 순서 유지)
+    doc_cnt = Counter({t: c for t, c in Counter(tokens(text)).items() if not drop_label_token(t, km)})
+    risk_map = risk_keywords()[0]
     bonus = Counter()
-    for t in list(doc_cnt.keys()):
-        if t in RISK_KEYWORDS:
-            bonus[RISK_KEYWORDS[t]] += doc_cnt[t]
-    doc_cnt += bonus
-    kb = st.session_state["kb_terms"]
-    if kb:
-        for t, c in kb.items():
-            if not drop_label_token(t):
-                doc_cnt[t] += 0.2 * c
+    for t, c in doc_cnt.items():
+        if t in risk_map: bonus[risk_map[t]] += c
+    doc_cnt.update(bonus)
+    for t, w in _kb_label_weights(km):
+        doc_cnt[t] += w
     if not doc_cnt: return ["안전보건","교육"]
-    commons = {"안전","교육","작업","현장","예방","조치","확인","관리","점검","가이드","지침"}
-    if st.session_state.get("profile_km"):
-        commons |= {"철저","작업방법","안전작업방법","허가","감시자","설치","준수","콘텐츠","동영상","숏츠","그림파일","텍스트"}
-    action_set = set(["설치","배치","착용","점검","확인","측정","기록","표시","제공","비치","보고","신고","교육","주지","중지","통제","휴식","환기","차단","교대","배제","배려","가동","준수","운영","유지","교체","정비","청소","고정","격리","보호","보수","작성","지정","실시","연결","해제","정지","부착"])
-    cand = [(t, doc_cnt[t]) for t in doc_cnt if t not in commons and t not in action_set and len(t) >= 2]
-    if not cand: cand = [(t, doc_cnt[t]) for t in doc_cnt if t not in commons]
-    cand.sort(key=lambda x: x[1], reverse=True)
-    return [t for t,_ in cand[:k]]
+    commons = LABEL_COMMONS | LABEL_KM_WORDS if km else LABEL_COMMONS
+    cand = Counter({t: c for t, c in doc_cnt.items() if t not in commons and t not in LABEL_ACTIONS and len(t) >= 2})
+    if not cand: cand = Counter({t: c for t, c in doc_cnt.items() if t not in commons})
+    return [t for t, _ in cand.most_common(k)]  # 힙 기반 top-k(동점은 등장 순서 유지)
 
 def dynamic_topic_label(text: str) -> str:
     terms = top_terms_for_label(text, k=3)
-    risks = [RISK_KEYWORDS.get(t, t) for t in terms if t in RISK_KEYWORDS or t in RISK_KEYWORDS.values()]
+    risk_map, risk_terms = risk_keywords()
+    risks = [risk_map.get(t, t) for t in terms if t in risk_terms]
     extra = [t for t in terms if t not in risks]
-    label_core = " ".join(sorted(set(risks), key=risks.index)) or "안전보건"
+    label_core = " ".join(dict.fromkeys(risks)) or "안전보건"  # 첫 등장 순서 유지 중복 제거(index 정렬 키 없음)
     tail = " ".join(extra[:1])
     label = (label_core + (" " + tail if tail else "")).strip()
     if "재해예방" not in label:
@@ -886,25 +1275,20 @@ def dynamic_topic_label(text: str) -> str:
 
 # -------------------- 요약/생성(LLM-FREE) --------------------
 def ai_extract_summary_for_report(text: str, limit: int=8) -> List[str]:
-    sents = preprocess_text_to_sentences(text)
-    if not sents: return []
-    kb = st.session_state["kb_terms"]; total = sum(kb.values()) or 1
-    kb_boost = {t: 1.0 + (cnt/total)*3.0 for t, cnt in kb.items()} if kb else None
-    X, _ = sentence_tfidf_vectors(sents, kb_boost=kb_boost)
-    scores = textrank_scores(sents, X)
-    idx = mmr_select(sents, scores, X, limit, lam=0.7)
-    return [sents[i] for i in idx]
+    return ai_extract_summary(text, limit)  # 동일 계산 — 요약 캐시 공유
 
-def make_structured_script(text: str, max_points: int=6) -> str:
+def _script_key(text: str, max_points: int) -> tuple:
+    ss = st.session_state  # 대본은 KB 외에 도메인 템플릿/키메세지 옵션에도 좌우됨
+    return (text_digest(text), max_points, ss["kb_rev"], bool(ss.get("domain_toggle")), bool(ss.get("profile_km")))
+
+def _make_structured_script(text: str, max_points: int) -> str:
     topic_label = dynamic_topic_label(text)
     core = [soften(s) for s in ai_extract_summary_for_report(text, max_points)] if max_points > 0 else []
-    core_actions = [s for s in core if (re.search(ACTION_PAT, s) or is_prevention_sentence(s))]
-    core_actions = repair_action_fragments(core_actions)
 
     case_block_raw = extract_section_bullets(text, which="case")
     prev_block_raw = extract_section_bullets(text, which="prev")
 
-    sents_all = preprocess_text_to_sentences(text)
+    sents_all, _ = tokenize_doc(text)
     if not case_block_raw:
         case_block_raw = fallback_extract_cases(text, sents_all)
     if not prev_block_raw:
@@ -914,132 +1298,140 @@ def make_structured_script(text: str, max_points: int=6) -> str:
     prev_block_raw = repair_action_fragments(prev_block_raw)
     prev_block = [to_action_sentence(s, text) for s in prev_block_raw if is_meaningful_sentence(s)]
 
-    case_aux, risk_aux, ask_aux = [], [], []
+    # 요약 문장 분류는 1회 순회(판별 함수마다 한 번씩만 호출)
+    core_actions, case_aux, risk_aux, ask_aux = [], [], [], []
     for s in core:
+        if is_prevention_sentence(s): core_actions.append(s)  # ACTION_PAT 포함
         if is_accident_sentence(s): case_aux.append(naturalize_case_sentence(s))
         elif is_risk_sentence(s):   risk_aux.append(soften(s))
-        elif ("?" in s or "확인" in s or "점검" in s):
-            if not re.search(r"(OPS|VR|공단)", s):
+        elif _ASK_RE.search(s):
+            if not _PROMO_SRC_RE.search(s):
                 ask_aux.append(soften(s if s.endswith("?") else s + " 맞습니까?"))
 
-    act_aux = [to_action_sentence(s, text) for s in core_actions if is_meaningful_sentence(s)]
+    act_aux = [to_action_sentence(s, text) for s in repair_action_fragments(core_actions) if is_meaningful_sentence(s)]
 
     acts = prev_block + act_aux
     if len(acts) < 3 and st.session_state["kb_actions"]:
-        acts += kb_match_candidates(st.session_state["kb_actions"], text, 8, min_sim=0.10)
-
-    def uniq_keep(seq: List[str]) -> List[str]:
-        seen, out = set(), []
-        for x in seq:
-            k = re.sub(r"\s+","", x)
-            if k not in seen:
-                seen.add(k); out.append(x)
-        return out
+        acts += kb_match_candidates("kb_actions", text, 8, min_sim=0.10)
 
     cases = uniq_keep(cases_block + case_aux)
     risks  = uniq_keep(risk_aux)
-    asks   = uniq_keep(ask_aux or kb_match_candidates(st.session_state["kb_questions"], text, 4, min_sim=0.10))
+    asks   = uniq_keep(ask_aux or kb_match_candidates("kb_questions", text, 4, min_sim=0.10))
     acts   = uniq_keep(acts)
 
-    lines = []
-    lines.append(f"🦺 TBM 교육대본 – {topic_label}\n")
-    lines.append("◎ 도입")
-    lines.append(f"오늘은 최근 발생한 '{topic_label.replace(' 재해예방','')}' 사고 사례를 중심으로, 우리 현장에서 같은 사고를 예방하기 위한 안전조치를 함께 살펴보겠습니다.\n")
+    out = io.StringIO(); w = out.write
+    topic = topic_label.replace(' 재해예방','')
+    w("🦺 TBM 교육대본 – " + topic_label + "\n\n◎ 도입\n")
+    w("오늘은 최근 발생한 '" + topic + "' 사고 사례를 중심으로, 우리 현장에서 같은 사고를 예방하기 위한 안전조치를 함께 살펴보겠습니다.\n\n")
 
     if cases:
-        lines.append("◎ 사고 사례")
-        for c in cases: lines.append(f"- {c}")
-        lines.append("")
+        w("◎ 사고 사례\n")
+        for c in cases: w("- "); w(c); w("\n")
+        w("\n")
 
     if risks:
-        lines.append("◎ 주요 위험요인")
-        for r in risks: lines.append(f"- {r}")
-        lines.append("")
+        w("◎ 주요 위험요인\n")
+        for r in risks: w("- "); w(r); w("\n")
+        w("\n")
 
     if acts:
-        lines.append("◎ 예방조치 / 실천 수칙")
-        for i, a in enumerate(acts, 1): lines.append(f"{i}️⃣ {a}")
-        lines.append("")
+        w("◎ 예방조치 / 실천 수칙\n")
+        for i, a in enumerate(acts, 1): w(f"{i}️⃣ "); w(a); w("\n")
+        w("\n")
 
     if asks:
-        lines.append("◎ 현장 점검 질문")
-        for q in asks: lines.append(f"- {q}")
-        lines.append("")
+        w("◎ 현장 점검 질문\n")
+        for q in asks: w("- "); w(q); w("\n")
+        w("\n")
 
-    lines.append("◎ 마무리 당부")
-    lines.append("예방조치는 '선조치 후작업'이 원칙입니다. 오늘 작업 전, 각 공정별 위험요인을 다시 한 번 점검하고 필요한 보호구와 안전조치를 반드시 준비합시다.")
-    lines.append("◎ 구호")
-    lines.append("“한 번 더 확인! 한 번 더 점검!”")
-    return "\n".join(lines)
+    w("◎ 마무리 당부\n")
+    w("예방조치는 '선조치 후작업'이 원칙입니다. 오늘 작업 전, 각 공정별 위험요인을 다시 한 번 점검하고 필요한 보호구와 안전조치를 반드시 준비합시다.\n")
+    w("◎ 구호\n")
+    w("“한 번 더 확인! 한 번 더 점검!”")
+    return out.getvalue()
 
-def make_concise_report(text: str, max_points: int=6) -> str:
+_DIST_HEAD_RE = re.compile(r"(배포처|주소|홈페이지|VR|리플릿|콘텐츠|동영상|숏츠)")
+
+def _make_concise_report(text: str, max_points: int) -> str:
     sents = ai_extract_summary_for_report(text, max_points)
-    sents = [soften(s) for s in sents if not re.match(r"(배포처|주소|홈페이지|VR|리플릿|콘텐츠|동영상|숏츠)", s)]
+    sents = [soften(s) for s in sents if not _DIST_HEAD_RE.match(s)]
     cases_blk = [naturalize_case_sentence(s) for s in extract_section_bullets(text, "case")] or \
-                [naturalize_case_sentence(s) for s in fallback_extract_cases(text, preprocess_text_to_sentences(text))]
+                [naturalize_case_sentence(s) for s in fallback_extract_cases(text, tokenize_doc(text)[0])]
     prev_blk  = [to_action_sentence(s, text) for s in repair_action_fragments(
-                    extract_section_bullets(text, "prev") or fallback_extract_preventions(text, preprocess_text_to_sentences(text))
+                    extract_section_bullets(text, "prev") or fallback_extract_preventions(text, tokenize_doc(text)[0])
                  )]
 
-    act_src = [s for s in sents if (not is_accident_sentence(s)) and (is_prevention_sentence(s) or re.search(ACTION_PAT, s))]
-    act_src = repair_action_fragments(act_src)
-    cases = [naturalize_case_sentence(s) for s in sents if is_accident_sentence(s)]
-    risks  = [soften(s) for s in sents if (not is_accident_sentence(s)) and is_risk_sentence(s)]
-    acts   = [to_action_sentence(s, text) for s in act_src]
-
-    def uniq_keep(seq: List[str]) -> List[str]:
-        seen, out = set(), []
-        for x in seq:
-            k = re.sub(r"\s+","", x)
-            if k not in seen:
-                seen.add(k); out.append(x)
-        return out
+    # 1회 순회 분류: 사고 문장은 사고로만, 나머지는 위험요인/실천(둘 다 해당 가능)으로 배분
+    cases, risks, act_src = [], [], []
+    for s in sents:
+        if is_accident_sentence(s):
+            cases.append(naturalize_case_sentence(s)); continue
+        if is_risk_sentence(s): risks.append(soften(s))
+        if is_prevention_sentence(s): act_src.append(s)  # ACTION_PAT 포함
+    acts   = [to_action_sentence(s, text) for s in repair_action_fragments(act_src)]
 
     cases = uniq_keep(cases_blk + cases)[:6]
     risks  = uniq_keep(risks)[:6]
     acts   = uniq_keep(prev_blk + acts)[:12]
 
     topic = dynamic_topic_label(text)
-    lines = [f"📄 핵심요약 — {topic}\n"]
+    out = io.StringIO(); w = out.write
+    w("📄 핵심요약 — "); w(topic); w("\n")
     if cases:
-        lines.append("【사고 개요】"); lines.append("자료에서 확인된 주요 사고는 다음과 같습니다.")
-        for c in cases: lines.append(f"- {c}")
-        lines.append("")
+        w("\n【사고 개요】\n자료에서 확인된 주요 사고는 다음과 같습니다.")
+        for c in cases: w("\n- "); w(c)
+        w("\n")
     if risks:
-        lines.append("【주요 위험요인】"); lines.append("자료 전반에서 다음 요인이 반복적으로 나타났습니다.")
-        for r in risks: lines.append(f"- {r}")
-        lines.append("")
+        w("\n【주요 위험요인】\n자료 전반에서 다음 요인이 반복적으로 나타났습니다.")
+        for r in risks: w("\n- "); w(r)
+        w("\n")
     if acts:
-        lines.append("【예방/실천 요약】"); lines.append("현장에서 즉시 적용 가능한 핵심 수칙입니다.")
-        for a in acts: lines.append(f"- {a}")
-        lines.append("")
+        w("\n【예방/실천 요약】\n현장에서 즉시 적용 가능한 핵심 수칙입니다.")
+        for a in acts: w("\n- "); w(a)
+        w("\n")
     if not (cases or risks or acts):
-        lines.append("자료의 핵심을 간단히 정리하면 다음과 같습니다.")
-        for s in sents: lines.append(f"- {s}")
-    return "\n".join(lines)
+        w("\n자료의 핵심을 간단히 정리하면 다음과 같습니다.")
+        for s in sents: w("\n- "); w(s)
+    return out.getvalue()
+
+def make_structured_script(text: str, max_points: int=6) -> str:
+    return session_lru("_script_cache", ("structured",) + _script_key(text, max_points), lambda: _make_structured_script(text, max_points), 16)
+
+def make_concise_report(text: str, max_points: int=6) -> str:
+    return session_lru("_script_cache", ("concise",) + _script_key(text, max_points), lambda: _make_concise_report(text, max_points), 16)
 
 # -------------------- DOCX 내보내기 --------------------
 _XML_FORBIDDEN = r"[\x00-\x08\x0B\x0C\x0E-\x1F\uD800-\uDFFF\uFFFE\uFFFF]"
+_XML_FORBIDDEN_RE = re.compile(_XML_FORBIDDEN)
 def _xml_safe(s: str) -> str:
     if not isinstance(s, str): s = "" if s is None else str(s)
-    return rxx.sub(_XML_FORBIDDEN, "", s)
+    return _XML_FORBIDDEN_RE.sub("", s)
 
+@st.cache_data(max_entries=8, show_spinner=False)  # 순수 함수 — 같은 대본을 다시 생성(캐시 적중)하면 DOCX 재조립 생략
 def to_docx_bytes(script: str) -> bytes:
+    from docx import Document
+    from docx.shared import Pt
+    from docx.oxml import OxmlElement
+    from docx.oxml.ns import qn
     doc = Document()
     try:
         style = doc.styles["Normal"]; style.font.name = "Malgun Gothic"; style.font.size = Pt(11)
     except Exception:
         pass
-    for raw in script.split("\n"):
-        line = _xml_safe(raw)
-        p = doc.add_paragraph(line)
-        for run in p.runs:
-            try:
-                run.font.name = "Malgun Gothic"; run.font.size = Pt(11)
-            except Exception:
-                pass
-    bio = io.BytesIO(); doc.save(bio); bio.seek(0)
-    return bio.read()
+    # 글꼴은 Normal 스타일에만 지정 → 줄마다 <w:p><w:r><w:t>만 직접 생성해 일괄 삽입
+    paras = []
+    for line in _xml_safe(script).split("\n"):  # 금지 문자 집합에 \n 없음 → 전체 1회 치환 후 분할해도 동일
+        p = OxmlElement("w:p")
+        if line:
+            r = OxmlElement("w:r"); t = OxmlElement("w:t")
+            t.text = line; t.set(qn("xml:space"), "preserve")
+            r.append(t); p.append(r)
+        paras.append(p)
+    body = doc.element.body
+    pos = body.index(body.sectPr) if body.sectPr is not None else len(body)
+    body[pos:pos] = paras
+    bio = io.BytesIO(); doc.save(bio)
+    return bio.getvalue()
 
 # -------------------- UI(기존 구성 유지 / 텍스트만 업데이트) --------------------
 with st.sidebar:
@@ -1082,6 +1474,11 @@ with st.sidebar:
         value=True,
         help="키 메세지(OPS) 포맷에서 날짜/체크표/홍보 꼬리를 더 엄격하게 처리합니다."
     )
+    st.session_state["pdf_max_chars"] = st.number_input(
+        "📄 PDF 추출 상한(문자)",
+        min_value=10_000, max_value=5_000_000, value=PDF_MAX_CHARS, step=10_000,
+        help="PDF 한 건에서 이 분량까지만 페이지 순서대로 추출합니다. 긴 문서 처리 시간을 제한합니다."
+    )
 
 seed_kb_once()
 
@@ -1121,14 +1518,21 @@ def _show_ci_logo_in_sidebar(width=80):  # 사이즈를 80으로 조정하여 
 
 
 def reset_all():
+    kb_wait()
+    worker = st.session_state.pop("_kb_worker", None)
+    if worker is not None: worker[0].shutdown(wait=False)
     st.session_state.pop("manual_text", None)
     st.session_state.pop("edited_text", None)
     st.session_state.pop("zip_choice", None)
+    st.session_state.pop("_kb_seen", None)
+    st.session_state.pop("_zip_member_cache", None)
     st.session_state["kb_terms"] = Counter()
     st.session_state["kb_actions"] = []
     st.session_state["kb_questions"] = []
+    st.session_state["kb_risk_terms"] = {}
     st.session_state["uploader_key"] += 1
     st.session_state["seed_loaded"] = False
+    st.session_state["kb_rev"] += 1
     st.session_state["last_file_diag"] = {}
     st.session_state["last_extracted_cache"] = ""
     st.rerun()
@@ -1154,7 +1558,7 @@ with col1:
     )
 
     extracted: str = ""
-    zip_pdfs: Dict[str, bytes] = {}
+    zip_pdfs: Dict[str, zipfile.ZipInfo] = {}  # 이름 → 목록 정보만(본문은 필요할 때 멤버 단위로 읽음)
 
     if uploaded is not None:
         fname = (uploaded.name or "").lower()
@@ -1166,20 +1570,13 @@ with col1:
         if fname.endswith(".zip"):
             try:
                 with zipfile.ZipFile(io.BytesIO(raw_bytes), "r") as zf:
-                    for name in zf.namelist():
-                        if name.lower().endswith(".pdf"):
-                            data = zf.read(name); zip_pdfs[name] = data
+                    zip_pdfs = {i.filename: i for i in zf.infolist() if i.filename.lower().endswith(".pdf")}
                 if zip_pdfs:
-                    for nm, data in zip_pdfs.items():
-                        txt_all = read_pdf_text_from_bytes(data, fname=f"{fname}::{nm}")
-                        if txt_all.strip():
-                            kb_ingest_text(txt_all)
-                    kb_prune()
-                    first_name = sorted(zip_pdfs.keys())[0]
-                    extracted = read_pdf_text_from_bytes(zip_pdfs[first_name], fname=first_name)
-                    if extracted.strip():
-                        st.session_state["edited_text"] = extracted
-                        st.session_state["last_extracted_cache"] = extracted
+                    max_chars = int(st.session_state["pdf_max_chars"])
+                    for nm, info in zip_pdfs.items():  # 압축 해제+추출+학습은 워커에서, 화면은 선택 문서만 읽음
+                        kb_ingest_async(f"zip:{nm}:{info.CRC:08x}:{info.file_size}",
+                                        lambda nm=nm: extract_pdf_text(zip_read_member(raw_bytes, nm), max_chars)[0])
+                    first_name = min(zip_pdfs)
                     st.success(f"ZIP 감지: {len(zip_pdfs)}개 PDF, 첫 문서 자동 선택 → {_zip_display_name(first_name)}")
                 else:
                     st.error("ZIP 내에 PDF가 없습니다.")
@@ -1187,22 +1584,25 @@ with col1:
                 st.error(f"ZIP 해제 오류: {e}")
 
             if zip_pdfs:
-                chosen = st.selectbox("ZIP 내 PDF 선택", [_zip_display_name(nm) for nm in sorted(zip_pdfs.keys())], key="zip_choice")
-                if chosen:
-                    real = None
-                    for _nm in zip_pdfs.keys():
-                        if _zip_display_name(_nm) == chosen:
-                            real = _nm; break
-                    if real and zip_pdfs.get(real):
-                        extracted2 = read_pdf_text_from_bytes(zip_pdfs[real], fname=real)
-                    if extracted2.strip():
-                        st.session_state["edited_text"] = extracted2
-                        st.session_state["last_extracted_cache"] = extracted2
+                disp = {nm: _zip_display_name(nm) for nm in zip_pdfs}  # 표시명 변환은 멤버당 1회(목록·역조회 공용)
+                chosen = st.selectbox("ZIP 내 PDF 선택", [disp[nm] for nm in sorted(zip_pdfs)], key="zip_choice")
+                real = next((nm for nm, d in disp.items() if d == chosen), None) if chosen else None
+                if real:
+                    try:
+                        info = zip_pdfs[real]  # 선택 문서 압축 해제는 업로드·멤버당 1회(슬라이더/토글 재실행 때 재해제 안 함)
+                        member = session_lru("_zip_member_cache", (getattr(uploaded, "file_id", ""), real, info.CRC, info.file_size),
+                                             lambda: zip_read_member(raw_bytes, real), 1)
+                        extracted = read_pdf_text_from_bytes(member, fname=real)
+                    except Exception as e:
+                        st.error(f"ZIP 해제 오류: {e}")
+                    if extracted.strip():
+                        st.session_state["edited_text"] = extracted
+                        st.session_state["last_extracted_cache"] = extracted
 
         elif fname.endswith(".pdf"):
             extracted = read_pdf_text_from_bytes(raw_bytes, fname=fname)
             if extracted.strip():
-                kb_ingest_text(extracted); kb_prune()
+                kb_ingest_async(hashlib.blake2b(raw_bytes).hexdigest(), extracted)
                 st.session_state["edited_text"] = extracted
                 st.session_state["last_extracted_cache"] = extracted
             else:
@@ -1212,9 +1612,10 @@ with col1:
 
     pasted = (manual_text or "").strip()
     if pasted:
-        kb_ingest_text(pasted); kb_prune()
+        kb_ingest_async(hashlib.blake2b(pasted.encode("utf-8")).hexdigest(), pasted)
         st.session_state["edited_text"] = pasted
         st.session_state["last_extracted_cache"] = pasted
+    kb_progress_note()
 
     base_text = st.session_state.get("edited_text","")
     # # st.markdown("**추출/입력 텍스트 미리보기**")  # (hidden)  # UI 숨김(기능 유지)
@@ -1245,6 +1646,7 @@ with col2:
             st.warning("PDF/ZIP 업로드 또는 텍스트 입력 후 시도하세요.")
         else:
             with st.spinner("생성 중..."):
+                kb_wait()
                 if gen_mode == "자연스러운 교육대본":
                     script = make_structured_script(text_for_gen, max_points=max_points)
                     subtitle = "자연스러운 교육대본"